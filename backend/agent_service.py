@@ -1,6 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from backend.api import agent
+from backend.utils.openai_tool import close_http_client, llm_router
+from backend.utils.llm_scheduler import LLMOverloadedError, overloaded_handler, llm_scheduler
+from backend.utils import ngram_tool
+from backend.utils.metrics_tool import MetricsMiddleware, metrics_response
+from backend.utils.trace_tool import TraceMiddleware, get_trace, recent_traces
+import asyncio
+import os
 
 app = FastAPI(title="Med Copilot Agent Service (Port 8001)")
 origins = ["*"]
@@ -11,13 +18,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Server-Timing", "Retry-After"],
 )
 
+app.add_middleware(TraceMiddleware, service="agent")
+app.add_middleware(MetricsMiddleware, service="agent")
+
 app.include_router(agent.router, prefix="/api/agent", tags=["agent"])
+app.add_exception_handler(LLMOverloadedError, overloaded_handler)
+
+ngram_refresh_task = None
+
+@app.on_event("startup")
+async def startup_event():
+    global ngram_refresh_task
+    if ngram_tool.NGRAM_COMPLETION:
+        ngram_refresh_task = asyncio.create_task(ngram_tool.refresh_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if ngram_refresh_task:
+        ngram_refresh_task.cancel()
+    await close_http_client()
 
 @app.get("/api/status")
 def health_check():
-    return {"status": "agent_service_ok"}
+    return {"status": "agent_service_ok", "worker": os.getenv("WORKER_NAME", "agent")}
+
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
+@app.get("/api/traces")
+def list_traces(limit: int = 50):
+    return recent_traces(limit)
+
+@app.get("/api/traces/{trace_id}")
+def show_trace(trace_id: str):
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+@app.get("/api/scheduler")
+def scheduler_stats():
+    return llm_scheduler.stats()
+
+@app.get("/api/backends")
+def backend_stats():
+    return llm_router.stats()
 
 if __name__ == "__main__":
     import uvicorn
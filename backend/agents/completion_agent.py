@@ -1,11 +1,29 @@
-from backend.utils.openai_tool import GetOpenAI
-import json
+from backend.utils.openai_tool import AsyncGetOpenAI, LLMOverloadedError, parse_json_response
+from backend.utils.completion_prompts import PROMPT_VERSION
+from backend.utils.ngram_tool import ngram_completer, NGRAM_COMPLETION
+from backend.utils.cache_tool import BoundedCache, PredictionTrie
+from backend.utils.metrics_tool import Counter, agent_seconds, track_cache
+from backend.utils.trace_tool import span
+import hashlib
 import asyncio
-import functools
+import os
+
+SENTENCE_ENDINGS = "。；！？!?;\n"
+
+COMPLETION_CANDIDATES = int(os.getenv("COMPLETION_CANDIDATES", "1"))        # choices requested per LLM completion
+PREFIX_CACHE_KEYS = int(os.getenv("COMPLETION_PREFIX_CACHE_KEYS", "512"))   # (field, summary) tries kept
+PREFIX_CACHE_TTL = float(os.getenv("COMPLETION_PREFIX_CACHE_TTL", "900"))
+
+completion_sources = Counter("medcopilot_completions_total", "Completions served, by source.", ("source",))
+track_cache("ngram", ngram_completer.stats)
 
 class CompletionAgent:
     def __init__(self):
-        self.openai_tool = GetOpenAI()
+        self.openai_tool = AsyncGetOpenAI()
+
+        # (field_id, summary hash) -> PredictionTrie of recent completions
+        self.predictions = BoundedCache(PREFIX_CACHE_KEYS, PREFIX_CACHE_TTL)
+        self.prefix_hits = 0
         
         self.complete_prompt = """
 你是一个电子病历自动补全助手。医生正在填写【{field_name}】。
@@ -33,24 +51,20 @@ class CompletionAgent:
             return ""
         
         try:
-            prompt_text = prompt_template.format(summary=summary)
+            with span("prompt_render"):
+                prompt_text = prompt_template.format(summary=summary)
+
+            with agent_seconds.time(agent="completion", operation="draft"):
+                success, res = await self.openai_tool.get_respons(prompt_text, model="gpt-3.5-turbo", cache_version=PROMPT_VERSION, priority="draft")
 
-            import time
-            start_time = time.time()
-            loop = asyncio.get_running_loop()
-            success, res = await loop.run_in_executor(
-                None, 
-                functools.partial(self.openai_tool.get_respons, prompt_text, model="gpt-3.5-turbo")
-            )
-            duration = time.time() - start_time
-            
             if success:
-                print(f"[Profiling] Draft Generation Time ({field_id}): {duration:.4f}s")
                 draft = res.strip()
                 from backend.agents.terminology_agent import terminology_agent
                 draft = await terminology_agent.correct_text(draft)
                 return draft
             return ""
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             print(f"Draft Error: {e}")
             return ""
@@ -59,7 +73,7 @@ class CompletionAgent:
         """
         Generates AI inferred suggestions for specific fields (diagnosis, orders).
         """
-        from backend.utils.completion_prompts import FIELD_PROMPT
+        from backend.utils.completion_prompts import FIELD_PROMPTS
         inference_key = f"inferred_{field_id}"
         prompt_template = FIELD_PROMPTS.get(inference_key)
         
@@ -67,61 +81,239 @@ class CompletionAgent:
             return []
             
         try:
-            prompt_text = prompt_template.format(summary=summary)
+            with span("prompt_render"):
+                prompt_text = prompt_template.format(summary=summary)
 
-            loop = asyncio.get_running_loop()
-            success, res = await loop.run_in_executor(
-                None, 
-                functools.partial(self.openai_tool.get_respons, prompt_text, model="gpt-3.5-turbo")
-            )
+            success, res = await self.openai_tool.get_respons(prompt_text, model="gpt-3.5-turbo", cache_version=PROMPT_VERSION, priority="draft")
             
             if success:
-                lines = [line.strip() for line in res.strip().split('\n') if line.strip()]
-                clean_lines = []
-                for l in lines:
-                    import re
-                    l = re.sub(r'^[\-\*•\d\.]+\s*', '', l)
-                    if l: clean_lines.append(l)
-                return clean_lines
+                return self._clean_suggestions(res.strip().split('\n'))
             return []
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             print(f"Suggestion Error: {e}")
             return []
 
+    def _clean_suggestions(self, lines: list) -> list:
+        import re
+        clean_lines = []
+        for l in lines:
+            l = re.sub(r'^[\-\*•\d\.]+\s*', '', str(l).strip())
+            if l: clean_lines.append(l)
+        return clean_lines
+
+    async def generate_drafts(self, summary: str, field_ids: list) -> dict:
+        """
+        Drafts several fields (plus inferred diagnosis/orders suggestions) with
+        one structured-output LLM call. Fields missing from an unparsable or
+        incomplete reply fall back to the per-field prompts.
+        """
+        from backend.utils.completion_prompts import FIELD_PROMPTS, build_batch_draft_prompt
+        from backend.agents.terminology_agent import terminology_agent
+
+        field_ids = [fid for fid in dict.fromkeys(field_ids) if fid in FIELD_PROMPTS and not fid.startswith("inferred_")]
+        suggestion_fields = [fid for fid in field_ids if f"inferred_{fid}" in FIELD_PROMPTS]
+        drafts, suggestions = {}, {}
+        if not field_ids:
+            return {"drafts": drafts, "suggestions": suggestions}
+
+        try:
+            with span("prompt_render"):
+                prompt_text = build_batch_draft_prompt(summary, field_ids, suggestion_fields)
+
+            with agent_seconds.time(agent="completion", operation="batch_drafts"):
+                success, res = await self.openai_tool.get_respons(prompt_text, model="gpt-3.5-turbo", cache_version=PROMPT_VERSION, priority="draft")
+
+            if success:
+                data = parse_json_response(res)
+                raw_drafts = data.get("drafts") or {}
+                raw_suggestions = data.get("suggestions") or {}
+                for fid in field_ids:
+                    if isinstance(raw_drafts.get(fid), str):
+                        drafts[fid] = raw_drafts[fid].strip()
+                for fid in suggestion_fields:
+                    if isinstance(raw_suggestions.get(fid), list):
+                        suggestions[fid] = self._clean_suggestions(raw_suggestions[fid])
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            print(f"Batch Draft Error, falling back to per-field calls: {e}")
+
+        missing_drafts = [fid for fid in field_ids if fid not in drafts]
+        missing_suggestions = [fid for fid in suggestion_fields if fid not in suggestions]
+
+        corrected, fallback_drafts, fallback_suggestions = await asyncio.gather(
+            asyncio.gather(*[terminology_agent.correct_text(drafts[fid]) for fid in drafts]),
+            asyncio.gather(*[self.generate_draft(summary, fid) for fid in missing_drafts]),
+            asyncio.gather(*[self.generate_suggestions(summary, fid) for fid in missing_suggestions]),
+        )
+
+        drafts = dict(zip(list(drafts), corrected))
+        drafts.update(zip(missing_drafts, fallback_drafts))
+        suggestions.update(zip(missing_suggestions, fallback_suggestions))
+        return {"drafts": drafts, "suggestions": suggestions}
+
+    def _prediction_key(self, field_id: str, summary: str):
+        return (field_id, hashlib.md5((summary or "").encode("utf-8")).hexdigest())
+
+    def _remember(self, field_id: str, summary: str, current_text: str, completions: list):
+        """Stores predictions; the last one wins where they share a path."""
+        key = self._prediction_key(field_id, summary)
+        trie = self.predictions.get(key)
+        if trie is None:
+            trie = PredictionTrie()
+            self.predictions.set(key, trie)
+        for completion in completions:
+            trie.insert(current_text, completion)
+
+    def _local_completion(self, field_id: str, current_text: str, summary: str) -> str:
+        """
+        Answers without the LLM when possible: first by continuing an earlier
+        prediction the doctor is typing along, then from the n-gram model.
+        Returns "" to ask the LLM.
+        """
+        trie = self.predictions.get(self._prediction_key(field_id, summary))
+        if trie is not None:
+            completion = trie.lookup(current_text)
+            if completion:
+                self.prefix_hits += 1
+                completion_sources.inc(source="prefix")
+                return completion
+
+        if not NGRAM_COMPLETION:
+            return ""
+        completion, confidence = ngram_completer.complete(field_id, current_text, summary)
+        if completion:
+            completion_sources.inc(source="ngram")
+            self._remember(field_id, summary, current_text, [completion])
+        return completion
+
+    def _clean_completion(self, res: str, current_text: str) -> str:
+        completion = res.replace(current_text, "").strip()
+        if completion.startswith(current_text):
+            completion = completion[len(current_text):]
+        return completion
+
     async def complete_text(self, field_id: str, current_text: str, summary: str = "") -> str:
         """
         Completes the text based on current cursor context.
         """
         if not current_text:
             return ""
+
+        local = self._local_completion(field_id, current_text, summary)
+        if local:
+            return local
             
         try:
-            prompt_text = self.complete_prompt.format(
-                field_name=field_id,
-                full_text=current_text,
-                summary=summary if summary else "暂无上下文"
-            )
-            import time
-            start_time = time.time()
-            loop = asyncio.get_running_loop()
-            success, res = await loop.run_in_executor(
-                None,
-                functools.partial(self.openai_tool.get_respons, prompt_text, model="gpt-3.5-turbo")
-            )
-            duration = time.time() - start_time
-            
+            with span("prompt_render"):
+                prompt_text = self.complete_prompt.format(
+                    field_name=field_id,
+                    full_text=current_text,
+                    summary=summary if summary else "暂无上下文"
+                )
+            with agent_seconds.time(agent="completion", operation="complete"):
+                if COMPLETION_CANDIDATES > 1:
+                    success, res = await self.openai_tool.get_choices(prompt_text, model="gpt-3.5-turbo", n=COMPLETION_CANDIDATES, priority="completion")
+                else:
+                    success, res = await self.openai_tool.get_respons(prompt_text, model="gpt-3.5-turbo", cache_version=PROMPT_VERSION, priority="completion")
+                    res = [res] if success else res
+
             if not success:
                return ""
-            
-            print(f"[Profiling] Completion Time ({field_id}): {duration:.4f}s")
-            completion = res.replace(current_text, "").strip()
-            
-            if completion.startswith(current_text):
-                completion = completion[len(current_text):]
-                
-            return completion
+
+            completion_sources.inc(source="llm")
+            candidates = [c for c in (self._clean_completion(r, current_text) for r in res) if c]
+            if not candidates:
+                return ""
+
+            # Extra candidates only serve later prefix lookups; the first is the answer.
+            self._remember(field_id, summary, current_text, candidates[::-1])
+            return candidates[0]
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             print(f"Completion Error: {e}")
             return ""
 
+    def prefix_stats(self) -> dict:
+        return {"hits": self.prefix_hits, "tries": len(self.predictions)}
+
+    async def stream_draft(self, summary: str, field_id: str):
+        """
+        Streams a draft as terminology-corrected sentences: tokens are buffered
+        until a sentence ending, then the finished sentence is corrected and
+        yielded while the model keeps generating.
+        """
+        from backend.utils.completion_prompts import FIELD_PROMPTS
+        from backend.agents.terminology_agent import terminology_agent
+        prompt_template = FIELD_PROMPTS.get(field_id)
+        if not prompt_template:
+            print(f"Warning: No prompt found for field '{field_id}'")
+            return
+
+        with span("prompt_render"):
+            prompt_text = prompt_template.format(summary=summary)
+        buffer = ""
+        emitted = False
+
+        async for delta in self.openai_tool.stream_respons(prompt_text, model="gpt-3.5-turbo", priority="draft"):
+            buffer += delta
+            if not emitted:
+                buffer = buffer.lstrip()
+
+            cut = max(buffer.rfind(ch) for ch in SENTENCE_ENDINGS) + 1
+            if cut > 0:
+                sentence, buffer = buffer[:cut], buffer[cut:]
+                yield await terminology_agent.correct_text(sentence)
+                emitted = True
+
+        buffer = buffer.rstrip()
+        if buffer:
+            yield await terminology_agent.correct_text(buffer)
+
+    async def stream_completion(self, field_id: str, current_text: str, summary: str = ""):
+        """
+        Streams a ghost-text completion. An echo of `current_text` at the start
+        of the response is swallowed before anything is yielded.
+        """
+        if not current_text:
+            return
+
+        local = self._local_completion(field_id, current_text, summary)
+        if local:
+            yield local
+            return
+
+        with span("prompt_render"):
+            prompt_text = self.complete_prompt.format(
+                field_name=field_id,
+                full_text=current_text,
+                summary=summary if summary else "暂无上下文"
+            )
+        head = ""
+        checking_echo = True
+        streamed = ""
+
+        async for delta in self.openai_tool.stream_respons(prompt_text, model="gpt-3.5-turbo", priority="completion"):
+            if not checking_echo:
+                streamed += delta
+                yield delta
+                continue
+
+            head = (head + delta).lstrip()
+            if len(head) < len(current_text) and current_text.startswith(head):
+                continue
+
+            checking_echo = False
+            if head.startswith(current_text):
+                head = head[len(current_text):].lstrip()
+            if head:
+                streamed += head
+                yield head
+
+        if streamed.strip():
+            self._remember(field_id, summary, current_text, [streamed.strip()])
+
 completion_agent = CompletionAgent()
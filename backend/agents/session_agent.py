@@ -0,0 +1,180 @@
+from backend.agents.summary_agent import summary_agent
+from collections import OrderedDict
+import asyncio
+import os
+import time
+import uuid
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", "256"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))               # seconds
+SESSION_CHUNK_CHARS = int(os.getenv("SESSION_CHUNK_CHARS", "1500"))           # new dialogue per LLM update
+SESSION_SLOT_MAX_CHARS = int(os.getenv("SESSION_SLOT_MAX_CHARS", "300"))      # compact a slot beyond this
+SESSION_SLOT_MAX_ITEMS = int(os.getenv("SESSION_SLOT_MAX_ITEMS", "8"))
+SESSION_CHUNK_MAX_FAILURES = int(os.getenv("SESSION_CHUNK_MAX_FAILURES", "3"))  # failed updates before a chunk is skipped
+
+SUMMARY_SLOTS = OrderedDict([
+    ("symptoms", "症状"),
+    ("history", "病史"),
+    ("exams", "检查"),
+    ("diagnosis", "诊断"),
+    ("orders", "医嘱"),
+])
+
+
+class ConsultationSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.offset = 0                  # transcript characters already summarized
+        self.slots = {slot: [] for slot in SUMMARY_SLOTS}
+        self.version = 0
+        self.compactions = 0
+        self.failed_offset = None        # chunk start that the last update failed on
+        self.chunk_failures = 0
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def apply_delta(self, delta: dict) -> bool:
+        changed = False
+        for slot, change in delta.items():
+            if slot not in self.slots or not isinstance(change, dict):
+                continue
+            items = self.slots[slot]
+            for item in change.get("remove") or []:
+                if item in items:
+                    items.remove(item)
+                    changed = True
+            for item in change.get("add") or []:
+                item = str(item).strip()
+                if item and item not in items:
+                    items.append(item)
+                    changed = True
+        return changed
+
+    def oversized_slots(self) -> list:
+        return [
+            slot for slot, items in self.slots.items()
+            if len(items) > SESSION_SLOT_MAX_ITEMS or sum(len(i) for i in items) > SESSION_SLOT_MAX_CHARS
+        ]
+
+    def render(self) -> str:
+        """Plain-text summary fed to the draft/completion prompts."""
+        lines = []
+        for slot, label in SUMMARY_SLOTS.items():
+            if self.slots[slot]:
+                lines.append(f"{label}：{'；'.join(self.slots[slot])}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "offset": self.offset,
+            "version": self.version,
+            "summary": self.render(),
+            "slots": self.slots,
+        }
+
+
+class SessionAgent:
+    """
+    Server-side consultation sessions. Each holds how much of the transcript
+    has been consumed and a slot-structured summary that is updated from
+    deltas, so every update prompt carries a bounded summary plus only the
+    new dialogue. Sessions are LRU-bounded and evicted after idling.
+    """
+
+    def __init__(self):
+        self.sessions = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self.sessions.items() if now - s.last_active > SESSION_IDLE_TTL]:
+            del self.sessions[session_id]
+        while len(self.sessions) > SESSION_MAX:
+            self.sessions.popitem(last=False)
+
+    def create(self) -> ConsultationSession:
+        session = ConsultationSession(uuid.uuid4().hex)
+        self.sessions[session.session_id] = session
+        self._evict()
+        return session
+
+    def get(self, session_id: str):
+        self._evict()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_active = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def close(self, session_id: str) -> bool:
+        return self.sessions.pop(session_id, None) is not None
+
+    async def update(self, session: ConsultationSession, text: str, offset: int) -> dict:
+        """
+        `text` is the transcript starting at character `offset`. Anything
+        before the session's own offset was already summarized and is
+        skipped, so retries and overlapping posts are harmless.
+        """
+        async with session.lock:
+            skip = max(0, session.offset - offset)
+            new_text = text[skip:]
+            position = max(offset, session.offset)
+
+            try:
+                while new_text.strip():
+                    chunk = new_text[:SESSION_CHUNK_CHARS]
+                    delta = await summary_agent.update_slots(session.slots, SUMMARY_SLOTS, chunk)
+                    if delta is None:
+                        if session.failed_offset != position:
+                            session.failed_offset, session.chunk_failures = position, 0
+                        session.chunk_failures += 1
+                        if session.chunk_failures < SESSION_CHUNK_MAX_FAILURES:
+                            break
+                        # Skip a chunk the model keeps failing on rather than resending it forever.
+                        print(f"[Session {session.session_id}] Skipping chunk at {position} "
+                              f"after {session.chunk_failures} failed updates")
+                        delta = {}
+                    session.failed_offset, session.chunk_failures = None, 0
+                    if session.apply_delta(delta):
+                        session.version += 1
+                    position += len(chunk)
+                    new_text = new_text[len(chunk):]
+                else:
+                    position += len(new_text)
+            finally:
+                # Chunks merged before a failure (e.g. a 429 on a later chunk) stay consumed,
+                # so the client's retry does not summarize them twice.
+                session.offset = position
+                session.last_active = time.monotonic()
+
+            await self._compact(session)
+            session.last_active = time.monotonic()
+            return session.to_dict()
+
+    async def _compact(self, session: ConsultationSession):
+        oversized = session.oversized_slots()
+        if not oversized:
+            return
+
+        results = await asyncio.gather(*[
+            summary_agent.compact_items(SUMMARY_SLOTS[slot], session.slots[slot],
+                                        SESSION_SLOT_MAX_ITEMS // 2 or 1, SESSION_SLOT_MAX_CHARS // 2)
+            for slot in oversized
+        ])
+        for slot, compacted in zip(oversized, results):
+            if compacted:
+                session.slots[slot] = compacted
+            else:
+                # Keep the newest items when the LLM cannot compact.
+                items = session.slots[slot]
+                while len(items) > 1 and (len(items) > SESSION_SLOT_MAX_ITEMS or sum(len(i) for i in items) > SESSION_SLOT_MAX_CHARS):
+                    items.pop(0)
+            session.compactions += 1
+        session.version += 1
+
+    def stats(self) -> dict:
+        return {"sessions": len(self.sessions), "max_sessions": SESSION_MAX, "idle_ttl": SESSION_IDLE_TTL}
+
+
+session_agent = SessionAgent()
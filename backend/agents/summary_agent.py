@@ -1,11 +1,14 @@
-from backend.utils.openai_tool import GetOpenAI
-import asyncio
-import functools
+from backend.utils.openai_tool import AsyncGetOpenAI, LLMOverloadedError, parse_json_response
+from backend.utils.metrics_tool import agent_seconds
+from backend.utils.trace_tool import span
+import json
+
+PROMPT_VERSION = "summary-v1"
 
 class DialogueSummaryAgent:
     def __init__(self):
         # Use Custom Tool
-        self.openai_tool = GetOpenAI()
+        self.openai_tool = AsyncGetOpenAI()
         
         self.prompt_template = """
 你是一名专业的医疗助手，正在协助医生记录病历。
@@ -24,6 +27,40 @@ class DialogueSummaryAgent:
 4. 如果新增对话没有包含任何医疗信息（例如寒暄、噪音），请原样返回【当前总结】，仅当有新信息时才修改。
 5. 如果之前的总结中包含“医生建议做某检查”的内容，而【新增对话片段】或已有信息中包含了该检查的结果，请在更新后的总结中**删除**“建议做该检查”的相关描述，只保留检查结果。
 6. **直接返回更新后的总结内容**，不要包含"【当前总结】："、"总结："等任何标题或前缀，只输出纯文本内容。
+"""
+
+        self.slot_prompt_template = """
+你是一名专业的医疗助手，正在协助医生记录病历。病历总结按栏目存储，每个栏目是若干条简短条目。
+
+【当前总结】（JSON，键为栏目，值为条目列表）：
+{slots}
+
+栏目含义：{slot_labels}
+
+【新增对话片段】：
+{new_dialogue}
+
+**指令**：
+1. 只根据【新增对话片段】中的新医疗信息（症状、病史、检查、诊断、用药、医嘱等）输出对总结的修改。
+2. 新信息写入 add；与新信息矛盾或已过时的条目（例如已有结果的“建议做某检查”）原样写入 remove。
+3. 条目简洁、专业（使用医学术语），不要重复已有条目。
+4. 如果没有任何新医疗信息（寒暄、噪音），返回 {{}}。
+
+【返回格式】（严格 JSON，只包含有修改的栏目）：
+{{
+  "symptoms": {{"add": ["发热3天"], "remove": []}}
+}}
+"""
+
+        self.compact_prompt_template = """
+请将以下病历栏目“{label}”中的条目合并压缩为不超过 {max_items} 条，总字数不超过 {max_chars} 字。
+保留所有关键医疗信息（阳性症状、重要阴性、检查结果、诊断、用药），删除重复和次要描述。
+
+【条目】：
+{items}
+
+【返回格式】（严格 JSON）：
+{{"items": ["..."]}}
 """
 
     async def summarize(self, current_summary: str, new_dialogue: str) -> str:
@@ -36,28 +73,70 @@ class DialogueSummaryAgent:
                 current_summary = "暂无总结。"
                 
 
-            prompt_text = self.prompt_template.format(
-                current_summary=current_summary,
-                new_dialogue=new_dialogue
-            )
-            
-            import time
-            start_time = time.time()
-            loop = asyncio.get_running_loop()
-            success, out_msg = await loop.run_in_executor(
-                None,
-                functools.partial(self.openai_tool.get_respons, input_msg=prompt_text, model="gpt-3.5-turbo")
-            )
-            duration = time.time() - start_time
+            with span("prompt_render"):
+                prompt_text = self.prompt_template.format(
+                    current_summary=current_summary,
+                    new_dialogue=new_dialogue
+                )
             
+            with agent_seconds.time(agent="summary", operation="summarize"):
+                success, out_msg = await self.openai_tool.get_respons(input_msg=prompt_text, model="gpt-3.5-turbo", cache_version=PROMPT_VERSION, priority="summary")
+
             if success:
-                print(f"[Profiling] Summary Agent Time: {duration:.4f}s")
                 return out_msg.strip()
             else:
                 print(f"总结 Agent API 错误: {out_msg}")
                 return current_summary
                 
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             print(f"总结 Agent 错误: {e}")
             return current_summary
+
+    async def update_slots(self, slots: dict, slot_labels: dict, new_dialogue: str):
+        """
+        Asks for a structured delta {slot: {"add": [...], "remove": [...]}}
+        against the current slots. Returns None when the call or parse fails.
+        """
+        with span("prompt_render"):
+            prompt_text = self.slot_prompt_template.format(
+                slots=json.dumps(slots, ensure_ascii=False),
+                slot_labels="、".join(f"{k}={v}" for k, v in slot_labels.items()),
+                new_dialogue=new_dialogue
+            )
+        try:
+            with agent_seconds.time(agent="summary", operation="update_slots"):
+                success, out_msg = await self.openai_tool.get_respons(input_msg=prompt_text, model="gpt-3.5-turbo", cache_version=PROMPT_VERSION, priority="summary")
+
+            if not success:
+                print(f"总结 Agent API 错误: {out_msg}")
+                return None
+            delta = parse_json_response(out_msg)
+            return delta if isinstance(delta, dict) else None
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            print(f"总结 Agent 错误: {e}")
+            return None
+
+    async def compact_items(self, label: str, items: list, max_items: int, max_chars: int):
+        with span("prompt_render"):
+            prompt_text = self.compact_prompt_template.format(
+                label=label, max_items=max_items, max_chars=max_chars,
+                items="\n".join(f"- {item}" for item in items)
+            )
+        try:
+            success, out_msg = await self.openai_tool.get_respons(input_msg=prompt_text, model="gpt-3.5-turbo", cache_version=PROMPT_VERSION, priority="summary")
+            if not success:
+                print(f"总结压缩错误: {out_msg}")
+                return None
+            compacted = parse_json_response(out_msg).get("items")
+            if isinstance(compacted, list):
+                return [str(item).strip() for item in compacted if str(item).strip()]
+            return None
+        except Exception as e:
+            print(f"总结压缩错误: {e}")
+            return None
+
 summary_agent = DialogueSummaryAgent()
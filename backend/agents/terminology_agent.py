@@ -1,15 +1,34 @@
-from backend.utils.openai_tool import GetOpenAI
+from backend.utils.openai_tool import AsyncGetOpenAI, LLMOverloadedError, parse_json_response
+from backend.utils.term_matcher import TermMatcher, sentence_spans
+from backend.utils.cache_tool import BoundedCache, open_shared_cache
+from backend.utils.metrics_tool import agent_seconds, track_cache
+from backend.utils.trace_tool import span
 import asyncio
-import functools
 import hashlib
 import json
+import os
+import re
 from typing import List, Dict, Optional
 
+PROMPT_VERSION = "terminology-v1"
+
+# Ask the LLM about sentences the lexicon matcher has no unambiguous replacement for.
+TERMINOLOGY_LLM_FALLBACK = os.getenv("TERMINOLOGY_LLM_FALLBACK", "1") == "1"
+TERMINOLOGY_CACHE_SIZE = int(os.getenv("TERMINOLOGY_CACHE_SIZE", "4096"))     # sentences
+TERMINOLOGY_CACHE_TTL = float(os.getenv("TERMINOLOGY_CACHE_TTL", "3600"))
+TERMINOLOGY_SHARED_MAX_ENTRIES = int(os.getenv("TERMINOLOGY_SHARED_MAX_ENTRIES", "50000"))
+TERMINOLOGY_SHARED_MAX_AGE = float(os.getenv("TERMINOLOGY_SHARED_MAX_AGE", str(7 * 24 * 3600)))
+
+_CJK = re.compile(r'[\u4e00-\u9fff]')
+
 class TerminologyAgent:
     def __init__(self):
-        self.openai_tool = GetOpenAI()
+        self.openai_tool = AsyncGetOpenAI()
 
-        self.cache = {}
+        # Per-sentence results with sentence-relative offsets. LLM-checked sentences
+        # also go to the shared tier so every worker on the node reuses them.
+        self.cache = BoundedCache(TERMINOLOGY_CACHE_SIZE, TERMINOLOGY_CACHE_TTL)
+        self.shared = None
 
         self.terminology_map = {
             "肚子疼": "腹痛",
@@ -52,9 +71,20 @@ class TerminologyAgent:
             "伴", "伴有", "乏力", "心悸", "咽痛", "眩晕", "头晕",
             "纳差", "咳嗽", "咳痰", "胸闷", "气短", "恶心", "便秘",
             "失眠", "头痛", "腹胀", "黄痰", "白痰", "咯血", "呼吸困难",
-            "上呼吸道感染", "输液"
+            "上呼吸道感染", "输液",
+            # Compounds that contain a colloquial entry but mean something else.
+            "吐痰", "吐黄痰", "吐白痰", "吐字", "吞吐", "烧伤", "烧灼", "灼烧", "烧心", "燃烧"
         ]
 
+        # Context-dependent entries (single characters are always treated as such):
+        # reported as issues, never rewritten by correct_text().
+        self.ambiguous_terms = ["还有", "同时", "并且"]
+
+        self.matcher = TermMatcher(self.terminology_map, self.valid_terms, self.ambiguous_terms)
+        self.lexicon_version = self._compute_hash(
+            json.dumps([self.terminology_map, self.valid_terms, self.ambiguous_terms],
+                       ensure_ascii=False, sort_keys=True))[:12]
+
         self.check_prompt = """
 你是一名医学术语规范性检查专家。请对以下文本进行逐句检查，识别口语化表达并提供规范化建议。
 
@@ -103,67 +133,110 @@ class TerminologyAgent:
         return hashlib.md5(text.encode('utf-8')).hexdigest()
 
     async def check_terminology(self, text: str) -> List[Dict]:
+        """
+        Checks `text` sentence by sentence. Each sentence's issues are cached
+        on its own, so an edit only costs a check of the sentence it touched.
+        Lexicon replacements come from the local matcher; sentences where it
+        only found protected or ambiguous terms go to the LLM.
+        """
         if not text or not text.strip():
             return []
-        
-        print(f"[Terminology] Checking text: '{text}' (length: {len(text)})")
-        
-        text_hash = self._compute_hash(text)
-        if text_hash in self.cache:
-            print(f"[Cache Hit] {text_hash[:8]}")
-            return self.cache[text_hash]
-        
+
+        spans = sentence_spans(text)
+        results = [None] * len(spans)
+        pending = []
+        for i, (start, end) in enumerate(spans):
+            cached = self.cache.get(self._compute_hash(text[start:end]))
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        if pending:
+            with agent_seconds.time(agent="terminology", operation="check_sentences"):
+                checked = await asyncio.gather(*[self._check_sentence(text[spans[i][0]:spans[i][1]]) for i in pending])
+            for i, (sentence_issues, cacheable) in zip(pending, checked):
+                results[i] = sentence_issues
+                if cacheable:
+                    start, end = spans[i]
+                    self.cache.set(self._compute_hash(text[start:end]), sentence_issues)
+
+        issues = []
+        for (offset, _), sentence_issues in zip(spans, results):
+            for issue in sentence_issues:
+                issues.append({**issue, "start": issue["start"] + offset, "end": issue["end"] + offset})
+        return issues
+
+    async def _check_sentence(self, sentence: str):
+        """Returns (issues, cacheable); failed LLM calls are not cached."""
+        if self.matcher.replacements(sentence):
+            return self.matcher.issues(sentence), True
+        if not TERMINOLOGY_LLM_FALLBACK or not _CJK.search(sentence):
+            return self.matcher.issues(sentence), True
+
+        key = f"{PROMPT_VERSION}:{self.lexicon_version}:{self._compute_hash(sentence)}"
+        cached = await self._shared_call("get", key)
+        if cached is not None:
+            return json.loads(cached), True
+
+        issues = await self._llm_check(sentence)
+        if issues is None:
+            return self.matcher.issues(sentence), False
+        await self._shared_call("set", key, json.dumps(issues, ensure_ascii=False))
+        return issues, True
+
+    def get_shared(self):
+        if self.shared is None:
+            self.shared = open_shared_cache("terminology", TERMINOLOGY_SHARED_MAX_ENTRIES, TERMINOLOGY_SHARED_MAX_AGE)
+        return self.shared
+
+    async def _shared_call(self, method: str, *args):
+        """Shared-tier errors only cost a cache miss."""
         try:
+            return await asyncio.to_thread(getattr(self.get_shared(), method), *args)
+        except Exception as e:
+            print(f"Terminology shared cache error: {e}")
+            return None
 
-            terminology_str = "\n".join([f"- {k} → {v}" for k, v in self.terminology_map.items()])
-            valid_terms_str = "、".join(self.valid_terms)
-            
-            prompt = self.check_prompt.format(
-                terminology_map=terminology_str,
-                valid_terms=valid_terms_str,
-                text=text
-            )
-
-            loop = asyncio.get_running_loop()
-            success, response = await loop.run_in_executor(
-                None,
-                functools.partial(
-                    self.openai_tool.get_respons,
-                    input_msg=prompt,
-                    model="gpt-3.5-turbo"
+    async def _llm_check(self, text: str) -> Optional[List[Dict]]:
+        try:
+            with span("prompt_render"):
+                terminology_str = "\n".join([f"- {k} → {v}" for k, v in self.terminology_map.items()])
+                valid_terms_str = "、".join(self.valid_terms)
+
+                prompt = self.check_prompt.format(
+                    terminology_map=terminology_str,
+                    valid_terms=valid_terms_str,
+                    text=text
                 )
-            )
+
+            success, response = await self.openai_tool.get_respons(input_msg=prompt, model="gpt-3.5-turbo", priority="terminology")
             
             if not success:
                 print(f"LLM Error: {response}")
-                return []
+                return None
 
             try:
-                response = response.strip()
-                if "```json" in response:
-                    response = response.split("```json")[1].split("```")[0].strip()
-                elif "```" in response:
-                    response = response.split("```")[1].split("```")[0].strip()
-                
-                data = json.loads(response)
+                data = parse_json_response(response)
                 issues = data.get("issues", [])
                 
                 print(f"[Terminology] LLM returned {len(issues)} issues")
 
-                issues = self._repair_positions(text, issues)
-
-                self.cache[text_hash] = issues
-                
-                return issues
+                with span("position_repair"):
+                    return self._repair_positions(text, issues)
                 
             except json.JSONDecodeError as e:
                 print(f"JSON Parse Error: {e}")
                 print(f"Response: {response}")
-                return []
+                return None
                 
+        except LLMOverloadedError as e:
+            # Shed under load: the sentence stays uncached and is retried on the next check.
+            print(f"Terminology Check Shed: {e}")
+            return None
         except Exception as e:
             print(f"Terminology Check Error: {e}")
-            return []
+            return None
     
     def _repair_positions(self, text: str, issues: List[Dict]) -> List[Dict]:
         repaired = []
@@ -197,24 +270,12 @@ class TerminologyAgent:
         return repaired
 
     async def correct_text(self, text: str) -> str:
+        """Lexicon-only normalization of unambiguous entries; never waits on the LLM."""
         if not text:
             return text
-            
-        issues = await self.check_terminology(text)
-        
-        issues.sort(key=lambda x: x["start"], reverse=True)
-        
-        corrected_text = list(text)
-        for issue in issues:
-            start = issue["start"]
-            end = issue["end"]
-            suggestion = issue["suggestion"]
-            
-            if start < 0 or end > len(text) or start >= end:
-                continue
-            
-            corrected_text[start:end] = list(suggestion)
-            
-        return "".join(corrected_text)
+        with span("terminology.correct"):
+            return self.matcher.apply(text)
 
 terminology_agent = TerminologyAgent()
+track_cache("terminology", terminology_agent.cache.stats)
+track_cache("terminology_shared", lambda: terminology_agent.get_shared().stats())
@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List
 from backend.agents.summary_agent import summary_agent
+from backend.agents.session_agent import session_agent
+from backend.utils.openai_tool import LLMError, LLMOverloadedError, llm_flight, llm_router
+from backend.utils.llm_scheduler import llm_scheduler
+from backend.utils.cancel_tool import LatestOnly
+from backend.utils.ngram_tool import ngram_completer
+import asyncio
+from backend.utils.sse_tool import sse_event, SSE_HEADERS
 
 router = APIRouter()
 
@@ -19,20 +28,68 @@ async def update_summary(request: SummaryRequest):
             new_dialogue=request.new_text
         )
         return SummaryResponse(updated_summary=updated_text)
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"API Error: {e}")
         return SummaryResponse(updated_summary=request.current_summary)
 
+class SessionUpdateRequest(BaseModel):
+    text: str
+    offset: int = 0
+
+@router.post("/session")
+async def create_session():
+    return session_agent.create().to_dict()
+
+@router.get("/session/{session_id}")
+async def get_session(session_id: str):
+    session = session_agent.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session.to_dict()
+
+@router.post("/session/{session_id}/update")
+async def update_session(session_id: str, req: SessionUpdateRequest):
+    """
+    Incremental summary: `text` is the transcript from character `offset`
+    on. Returns the rendered summary, the structured slots and the offset
+    the session has consumed up to.
+    """
+    session = session_agent.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return await session_agent.update(session, req.text, req.offset)
+
+@router.delete("/session/{session_id}")
+async def close_session(session_id: str):
+    return {"closed": session_agent.close(session_id)}
+
 from backend.agents.completion_agent import completion_agent
 
 class DraftRequest(BaseModel):
     summary: str
     field_id: str
 
+class BatchDraftRequest(BaseModel):
+    summary: str
+    field_ids: List[str]
+
 class CompletionRequest(BaseModel):
     field_id: str
     current_text: str
     summary: str = ""
+    session_id: str = ""    # with field_id, identifies requests a newer one supersedes
+
+# One in-flight ghost completion per (session, field).
+completion_requests = LatestOnly()
+
+def completion_key(req: CompletionRequest):
+    return f"{req.session_id}:{req.field_id}" if req.session_id else None
+
+async def wait_for_disconnect(request: Request, interval: float = 0.25):
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
 
 @router.post("/draft")
 async def generate_draft(req: DraftRequest):
@@ -46,7 +103,88 @@ async def generate_draft(req: DraftRequest):
         
     return response
 
+@router.post("/drafts")
+async def generate_drafts(req: BatchDraftRequest):
+    """
+    All requested fields in one LLM call:
+    {"drafts": {field_id: text}, "suggestions": {"diagnosis": [...], "orders": [...]}}
+    """
+    return await completion_agent.generate_drafts(req.summary, req.field_ids)
+
 @router.post("/complete")
-async def complete_text(req: CompletionRequest):
-    text = await completion_agent.complete_text(req.field_id, req.current_text, req.summary)
+async def complete_text(req: CompletionRequest, request: Request):
+    """
+    A newer request for the same session+field, or the client going away,
+    cancels this one (and its upstream LLM call); it then answers
+    {"completion": "", "cancelled": reason}.
+    """
+    ticket = completion_requests.begin(completion_key(req))
+    watcher = asyncio.create_task(wait_for_disconnect(request))
+    watcher.add_done_callback(lambda _: ticket.cancel("disconnected"))
+    failed = True
+    try:
+        text = await ticket.run(completion_agent.complete_text(req.field_id, req.current_text, req.summary))
+        failed = False
+    finally:
+        watcher.cancel()
+        completion_requests.end(ticket, failed=failed)
+    if ticket.cancelled:
+        return {"completion": "", "cancelled": ticket.reason}
     return {"completion": text}
+
+@router.get("/complete/stats")
+async def completion_stats():
+    return {"completions": completion_requests.stats(), "scheduler": llm_scheduler.stats(), "llm": llm_flight.stats(), "ngram": ngram_completer.stats(),
+            "prefix": completion_agent.prefix_stats(), "backends": llm_router.stats()}
+
+@router.post("/draft/stream")
+async def stream_draft(req: DraftRequest):
+    """
+    SSE variant of /draft: `data: {"delta": ...}` per corrected sentence,
+    then `event: suggestions` for diagnosis/orders and a final `event: done`.
+    """
+    async def events():
+        draft_text = ""
+        try:
+            async for sentence in completion_agent.stream_draft(req.summary, req.field_id):
+                draft_text += sentence
+                yield sse_event({"delta": sentence})
+
+            if req.field_id in ["diagnosis", "orders"]:
+                suggestions = await completion_agent.generate_suggestions(req.summary, req.field_id)
+                yield sse_event({"suggestions": suggestions}, event="suggestions")
+        except LLMError as e:
+            yield sse_event({"error": str(e)}, event="error")
+        except LLMOverloadedError as e:
+            yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+        yield sse_event({"draft": draft_text}, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/complete/stream")
+async def stream_complete(req: CompletionRequest):
+    async def events():
+        ticket = completion_requests.begin(completion_key(req))
+        text = ""
+        failed = False
+        try:
+            async for delta in ticket.stream(completion_agent.stream_completion(req.field_id, req.current_text, req.summary)):
+                text += delta
+                yield sse_event({"delta": delta})
+            if ticket.cancelled:
+                yield sse_event({"reason": ticket.reason}, event="cancelled")
+                return
+        except LLMError as e:
+            failed = True
+            yield sse_event({"error": str(e)}, event="error")
+        except LLMOverloadedError as e:
+            failed = True
+            yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+        except asyncio.CancelledError:
+            ticket.cancel("disconnected")     # client went away mid-stream
+            raise
+        finally:
+            completion_requests.end(ticket, failed=failed)
+        yield sse_event({"completion": text.strip()}, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
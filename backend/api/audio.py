@@ -1,105 +1,753 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
-from funasr import AutoModel
+from fastapi.responses import JSONResponse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from backend.utils import asr_worker
+from backend.utils.audio_tool import SAMPLE_RATE, AudioDecodeError, decode_audio, pcm16_to_float32
+from backend.utils.vad import VAD_ENDPOINT_MS, VAD_MIN_SPEECH_MS, gate_audio, get_offline_vad, get_streaming_vad, vad_stats
+from backend.utils.metrics_tool import CounterFunc, Gauge, Histogram
+from backend.utils.trace_tool import record_span, span
+import numpy as np
+import asyncio
+import json
+import multiprocessing
 import os
-import shutil
-import tempfile
-import uuid
 import time
-import re
-import subprocess
+import uuid
 
 router = APIRouter()
 
-print("Loading SenseVoiceSmall model...")
-try:
-    asr_model = AutoModel(
-        model="iic/SenseVoiceSmall",
-        device="cpu",
-        disable_update=True
+STREAM_PARTIAL_INTERVAL = 1.0   # seconds of new audio before the open segment is re-decoded
+STREAM_MAX_SEGMENT = 8.0        # seconds after which the open segment is finalized
+STREAM_BOUNDARY_SEARCH = 1.5    # seconds searched backwards for a quiet cut point
+STREAM_MIN_FINAL = 0.3          # shorter tails are dropped on flush
+
+ASR_MAX_BATCH_SIZE = int(os.getenv("ASR_MAX_BATCH_SIZE", "8"))
+ASR_MAX_WAIT_MS = float(os.getenv("ASR_MAX_WAIT_MS", "20"))
+ASR_WORKERS = int(os.getenv("ASR_WORKERS", "2"))                        # 0 = run in-process on one thread
+ASR_THREADS_PER_WORKER = int(os.getenv("ASR_THREADS_PER_WORKER", "2"))
+ASR_QUEUE_SIZE = int(os.getenv("ASR_QUEUE_SIZE", "64"))
+ASR_SHARE_WEIGHTS = os.getenv("ASR_SHARE_WEIGHTS", "1") == "1"         # load once in the forkserver, workers share it
+ASR_READY_TIMEOUT = float(os.getenv("ASR_READY_TIMEOUT", "5"))          # seconds a request waits for the model
+ASR_STARTUP_TIMEOUT = float(os.getenv("ASR_STARTUP_TIMEOUT", "600"))    # seconds for every worker to load and warm up
+ASR_PROBE_HOLD = 0.2                                                    # seconds a readiness probe occupies its worker
+
+LONG_SEGMENT_MAX = float(os.getenv("ASR_LONG_SEGMENT_MAX", "20"))       # seconds per segment of an uploaded recording
+LONG_JOB_CONCURRENCY = int(os.getenv("ASR_LONG_JOB_CONCURRENCY", "0"))  # 0 = workers x batch size
+LONG_JOB_KEEP = int(os.getenv("ASR_LONG_JOB_KEEP", "32"))               # finished jobs kept for polling
+LONG_JOB_READY_TIMEOUT = float(os.getenv("ASR_LONG_JOB_READY_TIMEOUT", "600"))  # seconds a job waits for the model
+ASR_MAX_UPLOAD_MB = float(os.getenv("ASR_MAX_UPLOAD_MB", "200"))        # larger uploads get a 413
+
+
+asr_batch_seconds = Histogram("medcopilot_asr_batch_duration_seconds", "Wall time of one ASR batch in the executor.")
+asr_rtf = Histogram("medcopilot_asr_real_time_factor", "ASR batch wall time divided by the audio duration it decoded.",
+                    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0))
+asr_batch_size = Histogram("medcopilot_asr_batch_size", "Segments per ASR batch.", buckets=(1, 2, 4, 8, 16, 32))
+
+
+class ASRQueueFullError(Exception):
+    pass
+
+
+class ASRNotReadyError(Exception):
+    pass
+
+
+def create_asr_executor():
+    if ASR_WORKERS <= 0:
+        asr_worker.init_worker(ASR_THREADS_PER_WORKER)
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr")
+
+    # Never fork the server itself: it runs threads, and torch does not survive a fork
+    # of an initialized process. Workers come from a forkserver (or are spawned).
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+        if ASR_SHARE_WEIGHTS:
+            mp_context.set_forkserver_preload(["backend.utils.asr_preload"])
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+
+    print(f"Starting {ASR_WORKERS} ASR workers ({ASR_THREADS_PER_WORKER} threads each)...")
+    return ProcessPoolExecutor(
+        max_workers=ASR_WORKERS,
+        mp_context=mp_context,
+        initializer=asr_worker.init_worker,
+        initargs=(ASR_THREADS_PER_WORKER,)
     )
-    print("SenseVoiceSmall model loaded successfully.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    asr_model = None
 
-def get_model():
-    return asr_model
 
-def process_audio_file(temp_path: str, filename_for_ext: str):
-    model = get_model()
-    if not model:
-         return {"text": ""}
+asr_executor = None
+asr_ready = asyncio.Event()
+asr_state = {
+    "status": "idle",
+    "error": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "restarts": 0,
+}
+_asr_load_task = None
 
-    processing_path = temp_path
 
+def start_asr_loading():
+    """
+    Called from the app startup hook. Starts the workers (each loads and warms
+    up the model in its initializer) in the background so the rest of the app
+    can serve requests immediately.
+    """
+    global _asr_load_task
+    if _asr_load_task is None:
+        _asr_load_task = asyncio.create_task(_load_asr())
+
+
+async def _load_asr():
+    global asr_executor
+    loop = asyncio.get_running_loop()
+    asr_state["status"] = "loading"
     start_time = time.time()
+
     try:
-        res = model.generate([processing_path], language="zh", use_itn=True, disable_pbar=True)
+        asr_executor = await loop.run_in_executor(None, create_asr_executor)
+        asr_scheduler.executor = asr_executor
+
+        asr_state["status"] = "warming_up"
+        statuses = await _probe_workers(loop)
+        asr_state["load_seconds"] = round(time.time() - start_time, 3)
+        warmups = [seconds for _, seconds in statuses if seconds is not None]
+        asr_state["warmup_seconds"] = max(warmups) if warmups else None
     except Exception as e:
-        print(f"Inference Error: {e}")
-        return {"text": ""}
-    
-    end_time = time.time()
-    duration = end_time - start_time
-
-    if os.path.exists(temp_path):
-        try: os.remove(temp_path)
-        except: pass
-
-    if res and len(res) > 0:
-        raw_text = res[0].get("text", "")
-        clean_text = re.sub(r'<\|.*?\|>', '', raw_text).strip()
-        
-        return {"text": clean_text}
-    else:
-        return {"text": ""}
+        print(f"ASR startup failed: {e}")
+        asr_state["status"] = "failed"
+        asr_state["error"] = str(e)
+        return
 
+    asr_state["status"] = "ready"
+    asr_state["error"] = None
+    asr_ready.set()
+    print(f"ASR ready (load {asr_state['load_seconds']}s, warm-up {asr_state['warmup_seconds']}s).")
+
+
+async def _probe_workers(loop) -> list:
+    """
+    (loaded, warm-up seconds) of every worker. A probe only runs once its
+    worker's initializer has loaded and warmed up the model, but the pool
+    may hand several probes to one worker, so rounds of concurrent probes
+    continue until every worker pid has answered.
+    """
+    expected = max(1, ASR_WORKERS)
+    deadline = time.monotonic() + ASR_STARTUP_TIMEOUT
+    seen = {}
+    while len(seen) < expected:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"only {len(seen)} of {expected} ASR workers became ready")
+        statuses = await asyncio.gather(*[
+            loop.run_in_executor(asr_executor, asr_worker.worker_status, ASR_PROBE_HOLD)
+            for _ in range(expected)
+        ])
+        for pid, loaded, seconds in statuses:
+            if not loaded:
+                raise RuntimeError("ASR model failed to load in one or more workers")
+            seen[pid] = (loaded, seconds)
+    return list(seen.values())
+
+
+def restart_asr(broken):
+    """
+    A worker died (crash, OOM kill) and took the pool down with it: mark ASR
+    as loading again and rebuild the pool. Requests meanwhile wait for
+    readiness or get a 503 like during startup.
+    """
+    global _asr_load_task
+    if broken is not asr_executor or asr_state["status"] in ("loading", "warming_up"):
+        return
+    print("ASR worker pool is broken, restarting it...")
+    asr_ready.clear()
+    asr_state["status"] = "loading"
+    asr_state["restarts"] += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+    _asr_load_task = asyncio.create_task(_load_asr())
+
+
+async def wait_until_ready(timeout: float = ASR_READY_TIMEOUT):
+    """Waits up to `timeout` seconds for the model; gives up at once if loading failed."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not asr_ready.is_set():
+        if asr_state["status"] == "failed":
+            raise ASRNotReadyError(asr_state["error"] or "ASR model failed to load")
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise ASRNotReadyError(f"ASR model is {asr_state['status']}")
+        try:
+            await asyncio.wait_for(asr_ready.wait(), min(remaining, 1.0))
+        except asyncio.TimeoutError:
+            pass
+
+
+def shutdown_asr():
+    if asr_executor is not None:
+        asr_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ASRBatchScheduler:
+    """
+    Collects segments from every open session for up to `max_wait_ms` and runs
+    them through the ASR workers as batches of at most `max_batch_size` items,
+    keeping up to `concurrency` batches in flight. Each submitter awaits its
+    own future; at most `max_queue` segments may be waiting.
+    """
+
+    def __init__(self, executor, concurrency: int = max(1, ASR_WORKERS),
+                 max_batch_size: int = ASR_MAX_BATCH_SIZE, max_wait_ms: float = ASR_MAX_WAIT_MS,
+                 max_queue: int = ASR_QUEUE_SIZE):
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue = max(1, max_queue)
+        self.queue = None
+        self.worker = None
+        self.slots = None
+        self.in_flight = 0
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+
+    def _ensure_worker(self):
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.slots = asyncio.Semaphore(self.concurrency)
+            self.worker = asyncio.create_task(self._run())
+
+    async def submit(self, audio: np.ndarray, block: bool = False) -> str:
+        """
+        Queue one segment. With block=False a full queue raises
+        ASRQueueFullError; with block=True the caller waits for room.
+        """
+        self._ensure_worker()
+        submitted = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        if block:
+            await self.queue.put((audio, future))
+        else:
+            try:
+                self.queue.put_nowait((audio, future))
+            except asyncio.QueueFull:
+                self.rejected += 1
+                raise ASRQueueFullError("ASR queue is full")
+        text, started, finished = await future
+        record_span("asr.queue", submitted, started)
+        record_span("asr.inference", started, finished)
+        return text
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return [item for item in batch if not item[1].done()]
+
+    async def _run(self):
+        while True:
+            await self.slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self.slots.release()
+                raise
+            if not batch:
+                self.slots.release()
+                continue
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: list):
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            texts = await loop.run_in_executor(executor, asr_worker.transcribe_batch, [audio for audio, _ in batch])
+        except BrokenProcessPool:
+            restart_asr(executor)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(ASRNotReadyError("ASR workers are restarting"))
+            return
+        except Exception as e:
+            # transcribe_batch handles model errors itself; anything else costs this batch its text.
+            print(f"ASR batch failed: {e}")
+            texts = [""] * len(batch)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+        seconds = time.perf_counter() - start
+        audio_seconds = sum(len(audio) for audio, _ in batch) / SAMPLE_RATE
+        asr_batch_seconds.observe(seconds)
+        asr_batch_size.observe(len(batch))
+        if audio_seconds > 0:
+            asr_rtf.observe(seconds / audio_seconds)
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), text in zip(batch, texts):
+            if not future.done():
+                future.set_result((text, start, start + seconds))
+
+    def stats(self) -> dict:
+        return {
+            "workers": ASR_WORKERS,
+            "threads_per_worker": ASR_THREADS_PER_WORKER,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
+
+
+asr_scheduler = ASRBatchScheduler(None)
+
+Gauge("medcopilot_asr_queue_depth", "Segments waiting for an ASR batch.").track(
+    lambda: asr_scheduler.queue.qsize() if asr_scheduler.queue else 0)
+Gauge("medcopilot_asr_executor_saturation", "Share of ASR executor slots running a batch.").track(
+    lambda: asr_scheduler.in_flight / asr_scheduler.concurrency)
+CounterFunc("medcopilot_asr_rejected_total", "Segments rejected because the ASR queue was full.").track(
+    lambda: asr_scheduler.rejected)
+
+
+class StreamingRecognizer:
+    """
+    Per-connection recognizer state for /ws.
+
+    The client streams 16 kHz mono PCM (s16le). With a VAD, silent frames are
+    dropped before they reach the model and a segment is closed (trailing
+    silence trimmed) after VAD_ENDPOINT_MS of silence. Only the open segment
+    is ever re-decoded, and it is force-finalized at STREAM_MAX_SEGMENT, so
+    the work per second of speech stays constant over the whole consultation.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, vad=None):
+        self.sample_rate = sample_rate
+        self.vad = vad
+        self.frame = vad.frame if vad else 0
+        self.endpoint = int(VAD_ENDPOINT_MS * sample_rate / 1000)
+        self.min_speech = int(VAD_MIN_SPEECH_MS * sample_rate / 1000)
+
+        self.remainder = np.zeros(0, dtype=np.float32)
+        self.preroll = np.zeros(0, dtype=np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.pieces = []
+        self.completed = []
+        self.stream_pos = 0
+        self.segment_start = 0
+        self.segment_index = 0
+        self.in_speech = vad is None
+        self.silence_run = 0
+        self.undecoded = 0
+        self.last_partial = ""
+
+    def _pending_audio(self) -> np.ndarray:
+        if self.pieces:
+            self.pending = np.concatenate([self.pending] + self.pieces)
+            self.pieces = []
+        return self.pending
+
+    def _pending_len(self) -> int:
+        return len(self.pending) + sum(len(p) for p in self.pieces)
+
+    def _reset_pending(self):
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.pieces = []
+        self.undecoded = 0
+        self.last_partial = ""
+
+    def feed(self, pcm_bytes: bytes):
+        samples = pcm16_to_float32(pcm_bytes)
+        if samples.size == 0:
+            return
+        vad_stats.record(total=len(samples))
+
+        if self.vad is None:
+            self.pieces.append(samples)
+            self.undecoded += len(samples)
+            self.stream_pos += len(samples)
+            return
+
+        buf = np.concatenate([self.remainder, samples])
+        n_frames = len(buf) // self.frame
+        self.remainder = buf[n_frames * self.frame:]
+        if n_frames == 0:
+            return
+
+        frames = buf[:n_frames * self.frame]
+        mask = self.vad.speech_mask(frames)
+
+        for i, is_speech in enumerate(mask):
+            chunk = frames[i * self.frame:(i + 1) * self.frame]
+            self.stream_pos += self.frame
+
+            if not self.in_speech:
+                if not is_speech:
+                    self.preroll = np.concatenate([self.preroll, chunk])[-self.vad.pad:]
+                    continue
+                self.in_speech = True
+                self.silence_run = 0
+                self.segment_start = self.stream_pos - self.frame - len(self.preroll)
+                self.pieces = [self.preroll, chunk]
+                self.undecoded = len(self.preroll) + len(chunk)
+                self.preroll = np.zeros(0, dtype=np.float32)
+                continue
+
+            self.pieces.append(chunk)
+            self.undecoded += len(chunk)
+            self.silence_run = 0 if is_speech else self.silence_run + len(chunk)
+
+            if self.silence_run >= self.endpoint:
+                self._close_segment()
+
+    def _close_segment(self):
+        audio = self._pending_audio()
+        keep = min(len(audio), len(audio) - self.silence_run + self.vad.pad)
+        if keep - self.vad.pad >= self.min_speech:
+            self.completed.append((self.segment_start, audio[:keep]))
+
+        self.preroll = audio[-self.vad.pad:] if self.vad.pad else audio[:0]
+        self.in_speech = False
+        self.silence_run = 0
+        self._reset_pending()
+
+    async def process(self, flush: bool = False) -> list:
+        events = []
+        max_len = int(STREAM_MAX_SEGMENT * self.sample_rate)
+
+        while self.completed:
+            start, audio = self.completed.pop(0)
+            events.append(await self._finalize_audio(start, audio))
+
+        while self._pending_len() >= max_len:
+            audio = self._pending_audio()
+            cut = find_quiet_cut(audio, max_len, self.sample_rate)
+            events.append(await self._finalize_audio(self.segment_start, audio[:cut]))
+            self.pending = audio[cut:]
+            self.segment_start += cut
+            self.undecoded = len(self.pending)
+            self.last_partial = ""
+
+        if flush:
+            audio = self._pending_audio()
+            if self.in_speech and len(audio) >= int(STREAM_MIN_FINAL * self.sample_rate):
+                events.append(await self._finalize_audio(self.segment_start, audio))
+            self._reset_pending()
+            self.segment_start = self.stream_pos
+            self.in_speech = self.vad is None
+            self.silence_run = 0
+        elif self.in_speech and self._pending_len() > 0 and self.undecoded >= int(STREAM_PARTIAL_INTERVAL * self.sample_rate):
+            decoded = self.undecoded
+            self.undecoded = 0
+            audio = self._pending_audio()
+            try:
+                text = await recognize_async(audio)
+            except (ASRQueueFullError, ASRNotReadyError):
+                # Partials are best effort; retry on the next frame.
+                self.undecoded = decoded
+                return events
+            if text != self.last_partial:
+                self.last_partial = text
+                events.append(self._event("partial", text, self.segment_start, self.segment_start + len(audio)))
+
+        return events
+
+    async def _finalize_audio(self, start: int, audio: np.ndarray) -> dict:
+        vad_stats.record(speech=len(audio))
+        error = None
+        try:
+            text = await recognize_async(audio, block=True, ready_timeout=ASR_READY_TIMEOUT)
+        except ASRNotReadyError as e:
+            text, error = "", str(e)
+
+        event = self._event("final", text, start, start + len(audio))
+        if error:
+            event["error"] = error
+        self.segment_index += 1
+        return event
+
+    def _event(self, kind: str, text: str, start: int, end: int) -> dict:
+        return {
+            "type": kind,
+            "segment": self.segment_index,
+            "text": text,
+            "start": round(start / self.sample_rate, 3),
+            "end": round(end / self.sample_rate, 3),
+        }
+
+
+def find_quiet_cut(audio: np.ndarray, max_len: int, sample_rate: int = SAMPLE_RATE) -> int:
+    """Lowest-energy 20 ms frame within STREAM_BOUNDARY_SEARCH seconds before max_len."""
+    frame = int(0.02 * sample_rate)
+    lo = max(0, max_len - int(STREAM_BOUNDARY_SEARCH * sample_rate))
+    window = audio[lo:max_len]
+    n_frames = len(window) // frame
+    if n_frames == 0:
+        return max_len
+
+    energy = np.square(window[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    return lo + int(np.argmin(energy)) * frame + frame // 2
+
+
+def plan_segments(audio: np.ndarray, regions: list, max_seconds: float = LONG_SEGMENT_MAX) -> list:
+    """
+    Group speech regions into (start, end) segments of at most `max_seconds`,
+    splitting single regions that are longer at their quietest point.
+    """
+    max_len = int(max_seconds * SAMPLE_RATE)
+    segments = []
+
+    for start, end in regions:
+        while end - start > max_len:
+            cut = start + find_quiet_cut(audio[start:end], max_len)
+            segments.append((start, cut))
+            start = cut
+        if segments and end - segments[-1][0] <= max_len and start - segments[-1][1] < SAMPLE_RATE:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+    return segments
+
+
+async def recognize_async(audio: np.ndarray, block: bool = False, ready_timeout: float = 0.0) -> str:
+    await wait_until_ready(ready_timeout)
+    return await asr_scheduler.submit(audio, block=block)
+
+
+@router.get("/ready")
+async def asr_readiness():
+    body = dict(asr_state)
+    body["scheduler"] = asr_scheduler.stats()
+    body["vad"] = vad_stats.as_dict()
+    if not asr_ready.is_set():
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    limit = int(ASR_MAX_UPLOAD_MB * 1024 * 1024)
+    data = await file.read(limit + 1)
+    if len(data) > limit:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {ASR_MAX_UPLOAD_MB:g} MB")
+    return data
 
-import asyncio
 
 @router.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
-    temp_dir = tempfile.gettempdir()
-    temp_filename = f"rec_{uuid.uuid4()}{os.path.splitext(file.filename)[1]}"
-    temp_path = os.path.join(temp_dir, temp_filename)
-    
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    data = await read_upload(file)
+
+    loop = asyncio.get_running_loop()
+    try:
+        with span("decode"):
+            audio = await loop.run_in_executor(None, decode_audio, data)
+    except AudioDecodeError as e:
+        print(f"Decode Error: {e}")
+        return {"text": ""}
+
+    with span("vad"):
+        audio = await loop.run_in_executor(None, gate_audio, audio)
+    if audio.size == 0:
+        return {"text": ""}
 
+    try:
+        return {"text": await recognize_async(audio, ready_timeout=ASR_READY_TIMEOUT)}
+    except ASRQueueFullError:
+        raise HTTPException(status_code=503, detail="ASR is busy, retry shortly")
+    except ASRNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+long_jobs = {}
+
+
+class LongTranscriptionJob:
+    def __init__(self, filename: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "queued"
+        self.error = None
+        self.duration = 0.0
+        self.segments = []
+        self.created = time.time()
+        self.finished = None
+        self.task = None
+
+    def to_dict(self, since: int = 0) -> dict:
+        done = [seg for seg in self.segments if seg["text"] is not None]
+        stitched = []
+        for seg in self.segments:
+            if seg["text"] is None:
+                break
+            stitched.append(seg["text"])
+
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "error": self.error,
+            "duration": self.duration,
+            "total_segments": len(self.segments),
+            "completed_segments": len(done),
+            "segments": [seg for seg in self.segments if seg["index"] >= since and seg["text"] is not None],
+            "text": "".join(stitched),
+            "elapsed": round((self.finished or time.time()) - self.created, 3),
+        }
+
+
+def _evict_long_jobs():
+    finished = sorted(
+        (job for job in long_jobs.values() if job.finished),
+        key=lambda job: job.finished
+    )
+    while len(long_jobs) > LONG_JOB_KEEP and finished:
+        long_jobs.pop(finished.pop(0).id, None)
+
+
+def _decode_and_plan(data: bytes):
+    audio = decode_audio(data)
+    vad = get_offline_vad()
+    regions = vad.speech_regions(audio) if vad else [(0, len(audio))]
+    speech = sum(end - start for start, end in regions)
+    vad_stats.record(total=len(audio), speech=speech, skipped_request=not regions)
+    return audio, plan_segments(audio, regions)
+
+
+async def _run_long_job(job: LongTranscriptionJob, data: bytes):
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, process_audio_file, temp_path, temp_filename)
+    try:
+        job.status = "decoding"
+        audio, plan = await loop.run_in_executor(None, _decode_and_plan, data)
+        del data
+        job.duration = round(len(audio) / SAMPLE_RATE, 3)
+        job.segments = [
+            {
+                "index": i,
+                "start": round(start / SAMPLE_RATE, 3),
+                "end": round(end / SAMPLE_RATE, 3),
+                "text": None,
+            }
+            for i, (start, end) in enumerate(plan)
+        ]
+
+        if not asr_ready.is_set():
+            job.status = "waiting_for_model"
+        await wait_until_ready(LONG_JOB_READY_TIMEOUT)
+        job.status = "transcribing"
+        limit = asyncio.Semaphore(LONG_JOB_CONCURRENCY or max(1, ASR_WORKERS) * ASR_MAX_BATCH_SIZE)
+
+        async def run_segment(segment: dict, start: int, end: int):
+            async with limit:
+                # A segment caught in a worker pool restart is retried once the pool is back.
+                for attempt in range(2):
+                    try:
+                        segment["text"] = await recognize_async(audio[start:end], block=True,
+                                                                ready_timeout=LONG_JOB_READY_TIMEOUT)
+                        return
+                    except ASRNotReadyError:
+                        if attempt:
+                            raise
+
+        tasks = [
+            asyncio.create_task(run_segment(segment, start, end))
+            for segment, (start, end) in zip(job.segments, plan)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        job.status = "done"
+    except Exception as e:
+        print(f"Long Transcription Error ({job.id}): {e}")
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished = time.time()
+        _evict_long_jobs()
+
+
+@router.post("/jobs")
+async def create_long_transcription(file: UploadFile = File(...)):
+    """
+    Transcribe a full uploaded recording. The file is split on speech
+    boundaries and the segments are fanned out over the ASR workers; poll
+    GET /jobs/{job_id} for segments as they complete. Jobs uploaded while
+    the model is loading wait for it.
+    """
+    data = await read_upload(file)
+    job = LongTranscriptionJob(file.filename or "")
+    long_jobs[job.id] = job
+    job.task = asyncio.create_task(_run_long_job(job, data))
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+async def get_long_transcription(job_id: str, since: int = 0):
+    job = long_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict(since)
 
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Streaming recognition.
+
+    Client -> server: binary frames of 16 kHz mono s16le PCM, text "ping",
+    or {"type": "stop"} to flush the open segment.
+    Server -> client: {"type": "partial" | "final", "segment", "text", "start", "end"}
+    with offsets in seconds from the start of the stream, and {"type": "done"}
+    after a stop has been flushed.
+    """
     await websocket.accept()
-    temp_dir = tempfile.gettempdir()
-    
+    recognizer = StreamingRecognizer(vad=get_streaming_vad())
+
     try:
         while True:
             message = await websocket.receive()
-            
+            if message.get("type") == "websocket.disconnect":
+                break
+
             if "bytes" in message and message["bytes"]:
-                data = message["bytes"]
-                if len(data) == 0: continue
-
-                temp_filename = f"ws_{uuid.uuid4()}.webm"
-                temp_path = os.path.join(temp_dir, temp_filename)
-                with open(temp_path, "wb") as f:
-                    f.write(data)
-                
-                loop = asyncio.get_running_loop()
-                result = await loop.run_in_executor(None, process_audio_file, temp_path, temp_filename)
-
-                await websocket.send_json(result)
-            
+                recognizer.feed(message["bytes"])
+                for event in await recognizer.process():
+                    await websocket.send_json(event)
+
             elif "text" in message and message["text"]:
 
                 if message["text"] == "ping":
                     continue
-            
+
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+
+                if isinstance(control, dict) and control.get("type") == "stop":
+                    for event in await recognizer.process(flush=True):
+                        await websocket.send_json(event)
+                    await websocket.send_json({"type": "done"})
+
     except WebSocketDisconnect:
         pass
     except Exception as e:
         print(f"WebSocket Error: {e}")
-
@@ -1,16 +1,34 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from backend.models import ChatMessage
-from backend.utils.openai_tool import GetOpenAI
+from backend.utils.openai_tool import AsyncGetOpenAI, LLMError, LLMOverloadedError
+from backend.utils.sse_tool import sse_event, SSE_HEADERS
 from typing import List
 
 router = APIRouter()
-openai_tool = GetOpenAI()
+openai_tool = AsyncGetOpenAI()
 
 @router.post("/message", response_model=ChatMessage)
-def chat(message: ChatMessage):
-    success, response_text = openai_tool.get_respons(message.content)
+async def chat(message: ChatMessage):
+    success, response_text = await openai_tool.get_respons(message.content)
     
     if not success:
         response_text = f"AI 服务异常: {response_text}"
     
     return ChatMessage(role="assistant", content=response_text)
+
+@router.post("/message/stream")
+async def chat_stream(message: ChatMessage):
+    async def events():
+        content = ""
+        try:
+            async for delta in openai_tool.stream_respons(message.content):
+                content += delta
+                yield sse_event({"delta": delta})
+        except LLMError as e:
+            yield sse_event({"error": f"AI 服务异常: {e}"}, event="error")
+        except LLMOverloadedError as e:
+            yield sse_event({"error": f"AI 服务繁忙: {e}", "retry_after": e.retry_after}, event="error")
+        yield sse_event({"role": "assistant", "content": content}, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
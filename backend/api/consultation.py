@@ -0,0 +1,244 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from backend.api.audio import StreamingRecognizer
+from backend.agents.terminology_agent import terminology_agent
+from backend.utils.openai_tool import get_http_client
+from backend.utils.worker_tool import pick_agent_url
+from backend.utils.trace_tool import start_trace, trace_headers
+from backend.utils.vad import get_streaming_vad
+import asyncio
+import httpx
+import json
+import os
+import time
+
+router = APIRouter()
+
+CONSULT_SUMMARY_MIN_CHARS = int(os.getenv("CONSULT_SUMMARY_MIN_CHARS", "40"))      # new transcript that triggers a summary
+CONSULT_SUMMARY_MAX_DELAY = float(os.getenv("CONSULT_SUMMARY_MAX_DELAY", "10"))   # seconds any new text may wait
+
+DRAFT_FIELDS = ['main_complaint', 'history_present_illness', 'past_history', 'physical_exam',
+                'auxiliary_exam', 'diagnosis', 'orders']
+
+
+class ConsultationChannel:
+    """
+    One consultation over one websocket: streaming ASR, then incremental
+    summary and drafts on the agent service, plus terminology checks of
+    the fields the client edits. Results are pushed as typed events.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.recognizer = StreamingRecognizer(vad=get_streaming_vad())
+        self.send_lock = asyncio.Lock()
+
+        self.transcript = ""
+        self.agent_url = None            # the agent worker holding this channel's session
+        self.session_id = None
+        self.summarized = 0              # transcript offset the agent session has consumed
+        self.summary = ""
+        self.summary_version = 0
+        self.pending_since = None        # when unsummarized text first appeared
+        self.summary_task = None
+        self.draft_task = None
+
+        self.summary_enabled = True
+        self.empty_fields = set()
+        self.field_tasks = {}
+
+    async def send(self, event: dict):
+        async with self.send_lock:
+            await self.websocket.send_json(event)
+
+    async def agent_post(self, path: str, body: dict = None):
+        if self.agent_url is None:
+            self.agent_url = await pick_agent_url()
+        return await get_http_client().post(f"{self.agent_url}/api/agent{path}", json=body, headers=trace_headers())
+
+    # --- transcript -> summary -> drafts ---
+
+    async def on_asr_events(self, events: list):
+        for event in events:
+            if event["type"] == "final" and event["text"]:
+                self.transcript += event["text"]
+                if self.pending_since is None:
+                    self.pending_since = time.monotonic()
+            await self.send(event)
+        self.maybe_summarize()
+
+    def maybe_summarize(self, force: bool = False):
+        new_chars = len(self.transcript) - self.summarized
+        if not self.summary_enabled or new_chars <= 0 or (self.summary_task and not self.summary_task.done()):
+            return
+        overdue = self.pending_since is not None and time.monotonic() - self.pending_since >= CONSULT_SUMMARY_MAX_DELAY
+        if force or new_chars >= CONSULT_SUMMARY_MIN_CHARS or overdue:
+            self.summary_task = asyncio.create_task(self.run_summary())
+
+    async def run_summary(self):
+        # Websocket jobs get their own trace; the id is passed on to the agent service.
+        with start_trace("consultation.summary", "main"):
+            await self._run_summary()
+
+    async def _run_summary(self):
+        try:
+            for _ in range(2):
+                if self.session_id is None:
+                    response = await self.agent_post("/session")
+                    response.raise_for_status()
+                    self.session_id = response.json()["session_id"]
+
+                response = await self.agent_post(
+                    f"/session/{self.session_id}/update",
+                    {"text": self.transcript[self.summarized:], "offset": self.summarized}
+                )
+                if response.status_code != 404:
+                    break
+                # Session expired on the agent service; replay the whole transcript.
+                self.session_id, self.summarized = None, 0
+            response.raise_for_status()
+            data = response.json()
+
+            self.summarized = data["offset"]
+            self.pending_since = time.monotonic() if self.summarized < len(self.transcript) else None
+            if data["summary"] != self.summary:
+                self.summary = data["summary"]
+                self.summary_version += 1
+                await self.send({"type": "summary", "version": self.summary_version,
+                                 "summary": self.summary, "slots": data["slots"]})
+                self.schedule_drafts()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, httpx.TransportError):
+                # The worker is gone; the next summary starts a session on another one.
+                self.agent_url, self.session_id, self.summarized = None, None, 0
+            print(f"Consultation summary error: {e}")
+            await self.send({"type": "error", "stage": "summary", "message": str(e)})
+
+    def schedule_drafts(self):
+        fields = [fid for fid in DRAFT_FIELDS if fid in self.empty_fields]
+        if not fields or not self.summary:
+            return
+        if self.draft_task and not self.draft_task.done():
+            self.draft_task.cancel()      # drafts for an older summary are no longer wanted
+        self.draft_task = asyncio.create_task(self.run_drafts(self.summary, self.summary_version, fields))
+
+    async def run_drafts(self, summary: str, version: int, fields: list):
+        with start_trace("consultation.drafts", "main"):
+            await self._run_drafts(summary, version, fields)
+
+    async def _run_drafts(self, summary: str, version: int, fields: list):
+        try:
+            response = await self.agent_post("/drafts", {"summary": summary, "field_ids": fields})
+            response.raise_for_status()
+            data = response.json()
+            await self.send({"type": "drafts", "version": version,
+                             "drafts": data.get("drafts", {}), "suggestions": data.get("suggestions", {})})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Consultation drafts error: {e}")
+            await self.send({"type": "error", "stage": "drafts", "message": str(e)})
+
+    # --- terminology ---
+
+    def check_field(self, field_id: str, text: str, rev):
+        previous = self.field_tasks.get(field_id)
+        if previous and not previous.done():
+            previous.cancel()
+        self.field_tasks[field_id] = asyncio.create_task(self.run_terminology(field_id, text, rev))
+
+    async def run_terminology(self, field_id: str, text: str, rev):
+        try:
+            issues = await terminology_agent.check_terminology(text)
+            await self.send({"type": "terminology", "field_id": field_id, "rev": rev, "text": text, "issues": issues})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Consultation terminology error: {e}")
+
+    # --- control messages ---
+
+    async def on_control(self, control: dict):
+        kind = control.get("type")
+        if kind == "config":
+            self.summary_enabled = bool(control.get("summary", True))
+        elif kind == "fields":
+            self.empty_fields = set(control.get("empty") or [])
+        elif kind == "field":
+            field_id, text = control.get("field_id"), control.get("text") or ""
+            if field_id:
+                self.empty_fields.discard(field_id)
+                self.check_field(field_id, text, control.get("rev"))
+        elif kind == "stop":
+            await self.on_asr_events(await self.recognizer.process(flush=True))
+            if self.summary_task:
+                await asyncio.gather(self.summary_task, return_exceptions=True)
+            self.maybe_summarize(force=True)
+            if self.summary_task:
+                await asyncio.gather(self.summary_task, return_exceptions=True)
+            await self.send({"type": "done", "transcript": self.transcript})
+
+    async def close(self):
+        for task in [self.summary_task, self.draft_task, *self.field_tasks.values()]:
+            if task and not task.done():
+                task.cancel()
+        if self.session_id:
+            try:
+                await get_http_client().delete(f"{self.agent_url}/api/agent/session/{self.session_id}")
+            except Exception:
+                pass
+
+
+@router.websocket("/ws")
+async def consultation_socket(websocket: WebSocket):
+    """
+    Multiplexed consultation channel.
+
+    Client -> server:
+      binary frames of 16 kHz mono s16le PCM, text "ping",
+      {"type": "config", "summary": bool}            turn automatic summaries on/off,
+      {"type": "fields", "empty": [field_id, ...]}   fields that may receive drafts,
+      {"type": "field", "field_id", "text", "rev"}    a field edit to check for terminology,
+      {"type": "stop"}                               flush ASR and the summary.
+    Server -> client:
+      {"type": "partial" | "final", ...}  as on /api/audio/ws,
+      {"type": "summary", "version", "summary", "slots"},
+      {"type": "drafts", "version", "drafts", "suggestions"},
+      {"type": "terminology", "field_id", "rev", "text", "issues"},
+      {"type": "error", "stage", "message"}, {"type": "done", "transcript"}.
+    Summaries run when CONSULT_SUMMARY_MIN_CHARS of new transcript arrive or
+    new text has waited CONSULT_SUMMARY_MAX_DELAY seconds, not on a timer.
+    """
+    await websocket.accept()
+    channel = ConsultationChannel(websocket)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message.get("type") == "websocket.disconnect":
+                break
+
+            if "bytes" in message and message["bytes"]:
+                channel.recognizer.feed(message["bytes"])
+                await channel.on_asr_events(await channel.recognizer.process())
+
+            elif "text" in message and message["text"]:
+
+                if message["text"] == "ping":
+                    continue
+
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+
+                if isinstance(control, dict):
+                    await channel.on_control(control)
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Consultation WebSocket Error: {e}")
+    finally:
+        await channel.close()
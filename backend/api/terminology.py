@@ -24,3 +24,7 @@ async def check_terminology(req: TerminologyCheckRequest):
         return TerminologyCheckResponse(issues=issues)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/terminology/stats")
+async def terminology_stats():
+    return {"cache": terminology_agent.cache.stats(), "shared": terminology_agent.get_shared().stats()}
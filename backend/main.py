@@ -1,8 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from backend.api import records, chat, audio, agent, terminology
+from backend.api import records, chat, audio, agent, terminology, consultation
+from backend.utils.openai_tool import close_http_client, llm_router
+from backend.utils.llm_scheduler import LLMOverloadedError, overloaded_handler
+from backend.utils.worker_tool import ready_agent_urls, public_url
+from backend.utils.metrics_tool import MetricsMiddleware, metrics_response
+from backend.utils.trace_tool import TraceMiddleware, get_trace, recent_traces
 import logging
 import os
 
@@ -18,6 +23,9 @@ class EndpointLogFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         log_msg = record.getMessage()
 
+        if "/metrics" in log_msg:
+            return False                # scraped constantly; latency is in the metrics themselves
+
         if "/api/status" in log_msg:
             self.status_counts += 1
             return self.status_counts % 5 == 1 
@@ -42,7 +50,11 @@ async def startup_event():
     logger = logging.getLogger("uvicorn.access")
     logger.addFilter(EndpointLogFilter())
 
+    audio.start_asr_loading()
+
     global agent_process
+    if os.getenv("SUPERVISED") == "1":
+        return              # backend.supervisor runs the agent service workers
     try:
 
         print("Starting Agent Service subprocess (module: backend.agent_service)...")
@@ -53,6 +65,8 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     global agent_process
+    audio.shutdown_asr()
+    await close_http_client()
     if agent_process:
         print("Terminating Agent Service subprocess...")
         agent_process.terminate()
@@ -66,17 +80,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Server-Timing", "Retry-After"],
 )
+app.add_middleware(TraceMiddleware, service="main")
+app.add_middleware(MetricsMiddleware, service="main")
 
 app.include_router(records.router, prefix="/api/records", tags=["records"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 app.include_router(audio.router, prefix="/api/audio", tags=["audio"])
 app.include_router(terminology.router, prefix="/api", tags=["terminology"])
+app.include_router(consultation.router, prefix="/api/consultation", tags=["consultation"])
+app.add_exception_handler(LLMOverloadedError, overloaded_handler)
 
 @app.get("/api/status")
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
+@app.get("/api/traces")
+def list_traces(limit: int = 50):
+    return recent_traces(limit)
+
+@app.get("/api/traces/{trace_id}")
+def show_trace(trace_id: str):
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+@app.get("/api/config")
+async def client_config(request: Request):
+    """Where the frontend should send agent calls; one ready worker is picked per page load."""
+    host = request.url.hostname or "localhost"
+    return {"agent_bases": [f"{public_url(url, host)}/api" for url in await ready_agent_urls()]}
+
+@app.get("/api/backends")
+def backend_stats():
+    return llm_router.stats()
+
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend")
 if not os.path.exists(frontend_path):
     os.makedirs(frontend_path)
@@ -0,0 +1,190 @@
+"""
+Runs Med Copilot as supervised worker processes:
+
+    python -m backend.supervisor
+
+MAIN_WORKERS processes of backend.main share MAIN_PORT (SO_REUSEPORT, the
+kernel spreads connections); each also listens on a private loopback port
+(MAIN_HEALTH_PORT + i) that its health checks go to. AGENT_WORKERS processes of
+backend.agent_service listen on AGENT_PORT, AGENT_PORT + 1, ...; agent
+sessions are in-process state, so clients pick one worker from
+/api/config and stay on it instead of going through a shared port.
+Crashed or unhealthy workers are restarted with backoff; on SIGTERM or
+Ctrl-C every worker is drained (uvicorn finishes in-flight requests for up
+to DRAIN_TIMEOUT seconds) before being killed.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+HOST = os.getenv("HOST", "0.0.0.0")
+MAIN_PORT = int(os.getenv("MAIN_PORT", "8000"))
+AGENT_PORT = int(os.getenv("AGENT_PORT", "8001"))
+MAIN_HEALTH_PORT = int(os.getenv("MAIN_HEALTH_PORT", "8100"))  # main worker i is checked on 127.0.0.1:MAIN_HEALTH_PORT + i
+MAIN_WORKERS = int(os.getenv("MAIN_WORKERS", "1"))          # each one loads its own ASR process pool
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "2"))
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "5"))  # seconds between /api/status checks
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "2"))
+HEALTH_FAILURES = int(os.getenv("HEALTH_FAILURES", "3"))    # failed checks before a ready worker is restarted
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", "180"))  # seconds a new worker may take to become ready
+RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", "30"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+
+APPS = {"main": "backend.main:app", "agent": "backend.agent_service:app"}
+
+
+def listen(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def serve(kind: str, port: int, reuse_port: bool, health_port: int = None):
+    """Worker process entry point."""
+    import uvicorn
+
+    sockets = [listen(HOST, port, reuse_port)]
+    if health_port:
+        sockets.append(listen("127.0.0.1", health_port))
+    config = uvicorn.Config(APPS[kind], timeout_graceful_shutdown=int(DRAIN_TIMEOUT))
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+class Worker:
+    def __init__(self, kind: str, index: int, port: int, env: dict, health_port: int = None):
+        self.kind = kind
+        self.name = f"{kind}-{index}"
+        self.port = port
+        self.health_port = health_port    # private port when `port` is shared
+        self.env = env
+        self.process = None
+        self.ready = False
+        self.started_at = 0.0
+        self.failures = 0
+        self.restarts = 0
+        self.next_start = 0.0
+
+    def start(self):
+        cmd = [sys.executable, "-m", "backend.supervisor", "--worker", self.kind, "--port", str(self.port)]
+        if self.kind == "main":
+            cmd.append("--reuse-port")
+        if self.health_port:
+            cmd += ["--health-port", str(self.health_port)]
+        self.process = subprocess.Popen(cmd, env={**os.environ, **self.env, "WORKER_NAME": self.name})
+        self.ready = False
+        self.failures = 0
+        self.started_at = time.monotonic()
+        print(f"[Supervisor] Started {self.name} (pid {self.process.pid}, port {self.port})")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def check(self, client: httpx.Client) -> bool:
+        try:
+            port = self.health_port or self.port
+            return client.get(f"http://127.0.0.1:{port}/api/status", timeout=HEALTH_TIMEOUT).status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def stop(self):
+        if self.alive():
+            self.process.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        if self.alive():
+            print(f"[Supervisor] {self.name} did not drain in time, killing")
+            self.process.kill()
+
+    def schedule_restart(self, reason: str):
+        self.stop()
+        backoff = min(RESTART_BACKOFF_MAX, 2 ** min(self.restarts, 5))
+        self.restarts += 1
+        self.ready = False
+        self.next_start = time.monotonic() + backoff
+        print(f"[Supervisor] {self.name} {reason}; restarting in {backoff:.0f}s")
+
+
+class Supervisor:
+    def __init__(self, main_workers: int = MAIN_WORKERS, agent_workers: int = AGENT_WORKERS):
+        agent_ports = [AGENT_PORT + i for i in range(agent_workers)]
+        shared_env = {
+            "SUPERVISED": "1",
+            "AGENT_SERVICE_URLS": ",".join(f"http://127.0.0.1:{port}" for port in agent_ports),
+        }
+        self.workers = [Worker("agent", i, port, shared_env) for i, port in enumerate(agent_ports)]
+        # One public port for all main workers; each is health-checked on its own port.
+        self.workers += [Worker("main", i, MAIN_PORT, shared_env, MAIN_HEALTH_PORT + i) for i in range(main_workers)]
+        self.stopping = False
+
+    def tick(self, client: httpx.Client):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is None or (not worker.alive() and worker.next_start and now >= worker.next_start):
+                worker.next_start = 0.0
+                worker.start()
+            elif not worker.alive():
+                if not worker.next_start:
+                    worker.schedule_restart(f"exited with code {worker.process.returncode}")
+            elif worker.next_start:
+                if now > worker.next_start + DRAIN_TIMEOUT:
+                    worker.kill()       # still draining long after it was due back
+            elif worker.check(client):
+                if not worker.ready:
+                    print(f"[Supervisor] {worker.name} ready after {now - worker.started_at:.1f}s")
+                    worker.restarts = 0
+                worker.ready, worker.failures = True, 0
+            elif worker.ready:
+                worker.failures += 1
+                if worker.failures >= HEALTH_FAILURES:
+                    worker.schedule_restart(f"failed {worker.failures} health checks")
+            elif now - worker.started_at > STARTUP_TIMEOUT:
+                worker.schedule_restart(f"not ready after {STARTUP_TIMEOUT:.0f}s")
+
+    def drain(self):
+        print("[Supervisor] Draining workers...")
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.monotonic() + DRAIN_TIMEOUT + 5
+        while any(w.alive() for w in self.workers) and time.monotonic() < deadline:
+            time.sleep(0.2)
+        for worker in self.workers:
+            worker.kill()
+
+    def run(self):
+        def on_signal(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, on_signal)
+        signal.signal(signal.SIGINT, on_signal)
+
+        with httpx.Client(trust_env=False) as client:
+            while not self.stopping:
+                self.tick(client)
+                slept = 0.0
+                while slept < HEALTH_INTERVAL and not self.stopping:
+                    time.sleep(0.2)
+                    slept += 0.2
+        self.drain()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worker", choices=sorted(APPS))
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--reuse-port", action="store_true")
+    parser.add_argument("--health-port", type=int)
+    args = parser.parse_args()
+
+    if args.worker:
+        serve(args.worker, args.port, args.reuse_port, args.health_port)
+    else:
+        Supervisor().run()
@@ -0,0 +1,11 @@
+"""
+Imported once by the ASR forkserver when ASR_SHARE_WEIGHTS=1. The forkserver
+is a fresh single-threaded process, so workers forked from it share the
+model weights copy-on-write without forking the threaded web server.
+"""
+from backend.utils import asr_worker
+
+try:
+    asr_worker.set_model(asr_worker.load_model())
+except Exception as e:
+    print(f"Error preloading model: {e}")
@@ -0,0 +1,130 @@
+import os
+import re
+import time
+
+from backend.utils.audio_tool import SAMPLE_RATE
+
+# Kept free of FastAPI/router imports: spawned ASR workers import only this module.
+
+ASR_MODEL_NAME = os.getenv("ASR_MODEL", "iic/SenseVoiceSmall")
+
+_model = None
+_warmup_seconds = None
+
+
+def load_model():
+    from funasr import AutoModel
+
+    print(f"Loading {ASR_MODEL_NAME} model (pid {os.getpid()})...")
+    model = AutoModel(
+        model=ASR_MODEL_NAME,
+        device="cpu",
+        disable_update=True
+    )
+    print(f"{ASR_MODEL_NAME} model loaded successfully.")
+    return model
+
+
+def set_model(model):
+    global _model
+    _model = model
+
+
+def get_model():
+    return _model
+
+
+def init_worker(num_threads: int):
+    """
+    Pool initializer. Pins torch to `num_threads` intra-op threads, loads
+    the model unless it was inherited from the forkserver, and warms it up
+    before the worker takes its first task.
+    """
+    global _model, _warmup_seconds
+    try:
+        import torch
+        torch.set_num_threads(max(1, num_threads))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    except ImportError:
+        pass
+
+    if _model is None:
+        try:
+            _model = load_model()
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            _model = None
+
+    start = time.perf_counter()
+    try:
+        if warmup():
+            _warmup_seconds = round(time.perf_counter() - start, 3)
+    except Exception as e:
+        print(f"ASR warm-up failed: {e}")
+
+
+def worker_status(hold: float = 0.0) -> tuple:
+    """
+    (pid, model loaded, warm-up seconds) of the worker that runs it. `hold`
+    keeps the worker busy briefly so concurrent probes reach other workers.
+    """
+    if hold > 0:
+        time.sleep(hold)
+    return os.getpid(), _model is not None, _warmup_seconds
+
+
+def warmup(seconds: float = 1.0) -> bool:
+    """
+    Push a short synthetic clip through the model so the first real request
+    does not pay for lazy allocations. Returns whether a model is loaded.
+    """
+    import numpy as np
+
+    if _model is None:
+        return False
+
+    noise = np.random.default_rng(0).normal(0.0, 0.01, int(seconds * SAMPLE_RATE)).astype(np.float32)
+    transcribe_batch([noise])
+    return True
+
+
+def clean_asr_text(raw_text: str) -> str:
+    return re.sub(r'<\|.*?\|>', '', raw_text).strip()
+
+
+def transcribe_batch(audios: list) -> list:
+    """
+    Run one SenseVoice forward pass over several 16 kHz arrays and return the
+    cleaned texts in input order. A failing batch is retried item by item so
+    one bad segment cannot blank out the others.
+    """
+    model = get_model()
+    texts = [""] * len(audios)
+    indices = [i for i, audio in enumerate(audios) if audio.size > 0]
+    if not model or not indices:
+        return texts
+
+    batch = [audios[i] for i in indices]
+    try:
+        res = model.generate(
+            input=batch, fs=SAMPLE_RATE, language="zh", use_itn=True,
+            batch_size=len(batch), disable_pbar=True
+        )
+    except Exception as e:
+        print(f"Inference Error: {e}")
+        res = None
+
+    if res is not None and len(res) == len(batch):
+        for i, item in zip(indices, res):
+            texts[i] = clean_asr_text(item.get("text", ""))
+        return texts
+
+    if len(batch) == 1:
+        return texts
+
+    for i in indices:
+        texts[i] = transcribe_batch([audios[i]])[0]
+    return texts
@@ -0,0 +1,95 @@
+import io
+import os
+import subprocess
+
+import numpy as np
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+
+SAMPLE_RATE = 16000
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def pcm16_to_float32(data: bytes) -> np.ndarray:
+    usable = len(data) - (len(data) % 2)
+    if usable <= 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def to_mono(audio: np.ndarray) -> np.ndarray:
+    if audio.ndim == 2:
+        audio = audio.mean(axis=1)
+    return audio.astype(np.float32, copy=False)
+
+
+def resample(audio: np.ndarray, orig_sr: int, target_sr: int = SAMPLE_RATE) -> np.ndarray:
+    if orig_sr == target_sr or audio.size == 0:
+        return audio.astype(np.float32, copy=False)
+
+    if soxr is not None:
+        return soxr.resample(audio, orig_sr, target_sr).astype(np.float32, copy=False)
+
+    # Linear interpolation fallback, evaluated over the whole signal at once.
+    duration = audio.shape[0] / orig_sr
+    target_len = int(round(duration * target_sr))
+    src_times = np.arange(audio.shape[0], dtype=np.float64) / orig_sr
+    dst_times = np.arange(target_len, dtype=np.float64) / target_sr
+    return np.interp(dst_times, src_times, audio).astype(np.float32)
+
+
+def decode_with_ffmpeg(data: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Pipe encoded bytes (webm/opus, mp3, m4a, ...) through ffmpeg and read back
+    mono s16le PCM at the target rate, without touching the filesystem.
+    """
+    cmd = [
+        FFMPEG_BINARY, "-nostdin", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", "1", "-ar", str(sample_rate),
+        "pipe:1",
+    ]
+    proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise AudioDecodeError(proc.stderr.decode("utf-8", errors="ignore").strip() or "ffmpeg failed")
+    return pcm16_to_float32(proc.stdout)
+
+
+def decode_with_soundfile(data: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    import soundfile as sf
+
+    try:
+        audio, orig_sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=False)
+    except Exception as e:
+        raise AudioDecodeError(str(e))
+    return resample(to_mono(audio), orig_sr, sample_rate)
+
+
+def decode_audio(data: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode an in-memory audio file to a float32 mono array at `sample_rate`.
+    WAV/FLAC/OGG go through libsndfile; everything else (notably the browser's
+    webm/opus) through an ffmpeg pipe.
+    """
+    if not data:
+        return np.zeros(0, dtype=np.float32)
+
+    if data[:4] in (b"RIFF", b"fLaC", b"OggS"):
+        try:
+            return decode_with_soundfile(data, sample_rate)
+        except AudioDecodeError:
+            pass
+
+    try:
+        return decode_with_ffmpeg(data, sample_rate)
+    except FileNotFoundError:
+        return decode_with_soundfile(data, sample_rate)
@@ -0,0 +1,337 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SHARED_CACHE = os.getenv("SHARED_CACHE", "sqlite")          # sqlite | redis | memory
+SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR", "backend/data/cache")
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "redis://127.0.0.1:6379/0")
+
+_MISSING = object()
+
+
+class BoundedCache:
+    """
+    In-memory LRU cache with an optional per-entry TTL and hit/miss
+    counters. Thread-safe so it can be shared with executor threads.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 0.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()    # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if not expires_at or expires_at > time.monotonic():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ex: float = None):
+        ttl = self.ttl if ex is None else ex
+        expires_at = time.monotonic() + ttl if ttl > 0 else 0.0
+        with self.lock:
+            self.data[key] = (expires_at, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SQLiteCache:
+    """
+    Persistent string cache in a local SQLite file, shared by every process
+    that opens the same path (WAL mode). Entries older than `max_age`
+    seconds (or than their own `ex`) are dropped, and beyond `max_entries`
+    the least recently used go first; eviction runs every `evict_every`
+    writes. Hits do not write: access times are buffered and flushed in one
+    transaction every `touch_every` hits or `touch_interval` seconds.
+    """
+
+    def __init__(self, path: str, max_entries: int = 20000, max_age: float = 0.0, evict_every: int = 100,
+                 touch_every: int = 256, touch_interval: float = 10.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evict_every = max(1, evict_every)
+        self.touch_every = max(1, touch_every)
+        self.touch_interval = touch_interval
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.touched = {}                # key -> access time not yet written
+        self.touched_at = time.time()
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+        if "expires_at" not in [row[1] for row in conn.execute("PRAGMA table_info(cache)")]:
+            conn.execute("ALTER TABLE cache ADD COLUMN expires_at REAL")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, created_at, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and (not self.max_age or now - row[1] <= self.max_age) and (row[2] is None or row[2] > now):
+            with self.lock:
+                self.hits += 1
+                self.touched[key] = now
+                flush = len(self.touched) >= self.touch_every or now - self.touched_at >= self.touch_interval
+            if flush:
+                self.flush_access_times()
+            return row[0]
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str, ex: float = None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (key, value, now, now, now + ex if ex else None)
+        )
+        conn.commit()
+        with self.lock:
+            self.writes += 1
+            evict = self.writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def flush_access_times(self):
+        with self.lock:
+            touched, self.touched = self.touched, {}
+            self.touched_at = time.time()
+        if touched:
+            conn = self._conn()
+            conn.executemany("UPDATE cache SET accessed_at = ? WHERE key = ?",
+                             [(at, key) for key, at in touched.items()])
+            conn.commit()
+
+    def delete(self, key: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        conn.commit()
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def evict(self):
+        self.flush_access_times()
+        conn = self._conn()
+        now = time.time()
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        if self.max_age:
+            conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.max_age,))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            " SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache")
+        conn.commit()
+
+    def stats(self) -> dict:
+        size = self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "size": size,
+                "max_entries": self.max_entries,
+                "max_age": self.max_age,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class RedisCache:
+    """
+    The same string cache on a Redis server, for sharing across nodes. Keys
+    are prefixed with `namespace`; size is left to Redis' maxmemory policy.
+    Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str, namespace: str, max_age: float = 0.0):
+        import redis
+
+        self.url = url
+        self.prefix = f"medcopilot:{namespace}:"
+        self.max_age = max_age
+        self.client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1.0)
+        self.client.ping()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, values):
+        with self.lock:
+            for value in values:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return values
+
+    def get(self, key: str):
+        return self._count([self.client.get(self.prefix + key)])[0]
+
+    def mget(self, keys):
+        return self._count(self.client.mget([self.prefix + key for key in keys])) if keys else []
+
+    def set(self, key: str, value: str, ex: float = None):
+        ttl = ex or self.max_age
+        # Whole seconds, rounded up: int() would turn a sub-second TTL into 0, which Redis rejects.
+        self.client.set(self.prefix + key, value, ex=math.ceil(ttl) if ttl else None)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*", count=500):
+            self.client.delete(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "url": self.url,
+                "prefix": self.prefix,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def open_shared_cache(namespace: str, max_entries: int = 20000, max_age: float = 0.0, path: str = None):
+    """
+    The node-wide cache tier for `namespace`, picked by SHARED_CACHE.
+    Every backend offers the same Redis-like string API (get, mget,
+    set(key, value, ex), delete, clear, stats), so callers store JSON text
+    and do not care which one they got:
+
+      sqlite  one WAL-mode file per namespace, shared by all workers on the node (default)
+      redis   SHARED_CACHE_URL, shared across nodes; falls back to sqlite if unreachable
+      memory  a per-process BoundedCache, for single-process runs
+    """
+    if SHARED_CACHE == "memory":
+        return BoundedCache(max_entries, max_age)
+    if SHARED_CACHE == "redis":
+        try:
+            return RedisCache(SHARED_CACHE_URL, namespace, max_age)
+        except Exception as e:
+            print(f"[Cache] Redis unavailable for {namespace} ({e}); using SQLite")
+    return SQLiteCache(path or os.path.join(SHARED_CACHE_DIR, f"{namespace}.sqlite3"), max_entries, max_age)
+
+
+class PredictionTrie:
+    """
+    Character trie over recent predictions (prefix + predicted continuation).
+    A later prefix that extends one of them along the predicted path is
+    answered by slicing the stored prediction. Holds at most `capacity`
+    predictions; the oldest are dropped by rebuilding.
+    """
+
+    def __init__(self, capacity: int = 16):
+        self.capacity = capacity
+        self.entries = []                # (full_text, prefix_len), oldest first
+        self.root = {}
+
+    def insert(self, prefix: str, completion: str):
+        if not completion:
+            return
+        full = prefix + completion
+        kept = [e for e in self.entries if e[0] != full]
+        kept = kept[max(0, len(kept) - self.capacity + 1):]
+        removed = len(kept) < len(self.entries)
+        self.entries = kept + [(full, len(prefix))]
+        if not removed:
+            self._add(full, len(prefix))
+        else:
+            # A dropped entry may still own nodes; rebuild so root matches entries.
+            self.root = {}
+            for entry in self.entries:
+                self._add(*entry)
+
+    def _add(self, full: str, prefix_len: int):
+        node = self.root
+        for i, ch in enumerate(full):
+            node = node.setdefault(ch, {})
+            if i + 1 >= prefix_len:
+                node[None] = full        # most recent prediction through this node
+
+    def lookup(self, text: str) -> str:
+        """Remaining predicted continuation of `text`, or ""."""
+        node = self.root
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                return ""
+        full = node.get(None)
+        if not full or len(full) <= len(text):
+            return ""
+        return full[len(text):]
@@ -0,0 +1,89 @@
+import asyncio
+
+
+class Ticket:
+    """One in-flight request registered under a key. See LatestOnly."""
+
+    def __init__(self, key):
+        self.key = key
+        self.task = None
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    async def run(self, coro):
+        """Awaits `coro` as a task this ticket can cancel; None if cancelled."""
+        self.task = asyncio.ensure_future(coro)
+        try:
+            return await self.task
+        except asyncio.CancelledError:
+            if self.cancelled:
+                return None
+            self.cancel("disconnected")
+            raise
+
+    async def stream(self, agen):
+        """Iterates an async generator, stopping (and closing it) once cancelled."""
+        try:
+            while not self.cancelled:
+                self.task = asyncio.ensure_future(agen.__anext__())
+                try:
+                    item = await self.task
+                except StopAsyncIteration:
+                    return
+                except asyncio.CancelledError:
+                    if self.cancelled:
+                        return
+                    self.cancel("disconnected")
+                    raise
+                yield item
+        finally:
+            # A still-running __anext__ was just cancelled and closes the generator itself.
+            if self.task is None or self.task.done():
+                await agen.aclose()
+
+
+class LatestOnly:
+    """
+    Keeps at most one in-flight request per key (e.g. session + field):
+    registering a new ticket cancels the previous one server-side, so
+    superseded LLM calls stop instead of running to completion.
+    """
+
+    def __init__(self):
+        self.tickets = {}
+        self.started = 0
+        self.outcomes = {"completed": 0, "superseded": 0, "disconnected": 0, "failed": 0}
+
+    def begin(self, key) -> Ticket:
+        ticket = Ticket(key)
+        self.started += 1
+        if key:
+            previous = self.tickets.get(key)
+            if previous is not None:
+                previous.cancel("superseded")
+            self.tickets[key] = ticket
+        return ticket
+
+    def end(self, ticket: Ticket, failed: bool = False):
+        if ticket.key and self.tickets.get(ticket.key) is ticket:
+            del self.tickets[ticket.key]
+        outcome = ticket.reason or ("failed" if failed else "completed")
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def stats(self) -> dict:
+        aborted = self.outcomes["superseded"] + self.outcomes["disconnected"]
+        return {
+            "started": self.started,
+            "in_flight": len(self.tickets),
+            **self.outcomes,
+            "aborted": aborted,
+        }
@@ -1,3 +1,6 @@
+# Bump when any prompt below changes so cached LLM answers are not reused.
+PROMPT_VERSION = "completion-v1"
+
 PROMPT_MAIN_COMPLAINT = """
 根据【对话总结】提取主诉。
 
@@ -161,3 +164,72 @@ FIELD_PROMPTS = {
     "inferred_diagnosis": PROMPT_INFERRED_DIAGNOSIS,
     "inferred_orders": PROMPT_INFERRED_ORDERS,
 }
+
+FIELD_NAMES = {
+    "main_complaint": "主诉",
+    "history_present_illness": "现病史",
+    "past_history": "既往史",
+    "physical_exam": "体格检查",
+    "auxiliary_exam": "辅助检查",
+    "diagnosis": "诊断",
+    "orders": "医嘱",
+}
+
+PROMPT_BATCH_DRAFTS = """
+根据【对话总结】一次性填写病历的多个字段。
+
+【对话总结】：
+{summary}
+
+【需要填写的字段及各自要求】：
+{field_sections}
+{suggestion_section}
+严格要求：
+1. 每个字段必须分别遵守其各自的要求，字段之间内容不要混淆
+2. 无相关信息的字段填写空字符串 ""
+3. **严禁**捏造对话中未提及的内容
+4. 只输出一个 JSON 对象，不要输出任何解释或 Markdown
+
+返回格式（严格 JSON）：
+{output_format}
+"""
+
+PROMPT_BATCH_SUGGESTIONS = """
+【AI 推断建议】：
+另外请在 "suggestions" 中为以下字段给出推断建议（每个字段 3-5 条，不要序号）：
+{suggestion_sections}
+"""
+
+
+def field_requirements(key: str) -> str:
+    """The per-field rules of FIELD_PROMPTS[key], without the summary block."""
+    import re
+
+    template = FIELD_PROMPTS[key]
+    rules = template.replace("【对话总结】：\n{summary}\n", "").replace("输出：", "").strip()
+    return re.sub(r"\n{3,}", "\n\n", rules)
+
+
+def build_batch_draft_prompt(summary: str, field_ids: list, suggestion_fields: list) -> str:
+    import json
+
+    field_sections = "\n".join(
+        f"### {fid}（{FIELD_NAMES.get(fid, fid)}）\n{field_requirements(fid)}\n"
+        for fid in field_ids
+    )
+
+    suggestion_section = ""
+    output = {"drafts": {fid: "..." for fid in field_ids}}
+    if suggestion_fields:
+        suggestion_section = PROMPT_BATCH_SUGGESTIONS.format(suggestion_sections="\n".join(
+            f"### {fid}（{FIELD_NAMES.get(fid, fid)}）\n{field_requirements(f'inferred_{fid}')}\n"
+            for fid in suggestion_fields
+        ))
+        output["suggestions"] = {fid: ["...", "..."] for fid in suggestion_fields}
+
+    return PROMPT_BATCH_DRAFTS.format(
+        summary=summary,
+        field_sections=field_sections,
+        suggestion_section=suggestion_section,
+        output_format=json.dumps(output, ensure_ascii=False, indent=2)
+    )
@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import time
+from collections import deque
+
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")                       # JSON list, see load_backends()
+LLM_HEDGE_CLASSES = set(filter(None, os.getenv("LLM_HEDGE_CLASSES", "completion,terminology").split(",")))
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.3"))       # seconds
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "1.5"))  # until enough samples
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))      # hedges per hedgeable request
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))        # samples per backend and priority class
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))       # consecutive failures that open it
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))    # seconds before a probe
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Backend:
+    """
+    One OpenAI-compatible endpoint. `models` maps the model names callers
+    ask for to the upstream name; None serves every model unchanged.
+    Latency is tracked per priority class: a keystroke completion and a
+    full summary have nothing in common but the backend.
+    """
+
+    def __init__(self, name: str, api_base: str, api_key: str, weight: float = 1.0, models: dict = None):
+        self.name = name
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+        self.weight = weight
+        self.models = models
+        self.latencies = {}              # priority class -> recent latencies
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.opened_at = None            # circuit open since; None when closed
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def url(self) -> str:
+        return f"{self.api_base}/chat/completions"
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def upstream_model(self, model: str) -> str:
+        return model if self.models is None else self.models[model]
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= LLM_BREAKER_COOLDOWN:
+            return "half-open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.probing)
+
+    def begin(self):
+        self.in_flight += 1
+        self.requests += 1
+        if self.state == "half-open":
+            self.probing = True
+
+    def success(self, seconds: float, priority: str):
+        self.in_flight -= 1
+        window = self.latencies.get(priority)
+        if window is None:
+            window = self.latencies[priority] = deque(maxlen=LLM_LATENCY_WINDOW)
+        window.append(seconds)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self, counts: bool = True):
+        """`counts` is False for errors that say nothing about the backend (4xx, cancellation)."""
+        self.in_flight -= 1
+        was_probe, self.probing = self.probing, False
+        if not counts:
+            return
+        self.errors += 1
+        self.consecutive_failures += 1
+        if was_probe or self.consecutive_failures >= LLM_BREAKER_FAILURES:
+            if self.opened_at is None or was_probe:
+                self.trips += 1
+                print(f"[LLMRouter] Circuit open for {self.name} after {self.consecutive_failures} failures")
+            self.opened_at = time.monotonic()
+
+    def hedge_delay(self, priority: str) -> float:
+        window = self.latencies.get(priority, ())
+        if len(window) < LLM_LATENCY_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, percentile(window, LLM_HEDGE_QUANTILE))
+
+    def stats(self) -> dict:
+        latency = {}
+        for priority, window in list(self.latencies.items()):
+            samples = list(window)
+            latency[priority] = {
+                "samples": len(samples),
+                "p50": round(percentile(samples, 0.5), 3),
+                "p95": round(percentile(samples, 0.95), 3),
+                "p99": round(percentile(samples, 0.99), 3),
+            }
+        return {
+            "api_base": self.api_base,
+            "weight": self.weight,
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "trips": self.trips,
+            "latency": latency,
+        }
+
+
+def load_backends(default_base: str, default_key: str) -> list:
+    """
+    Backends from LLM_BACKENDS, e.g.
+    [{"name": "primary", "api_base": "...", "api_key": "...", "weight": 3},
+     {"name": "local", "api_base": "...", "weight": 1, "models": {"gpt-4o": "qwen2.5-72b"}}];
+    without it, the single endpoint configured in openai_tool.
+    """
+    if not LLM_BACKENDS.strip():
+        return [Backend("default", default_base, default_key)]
+    backends = []
+    for i, spec in enumerate(json.loads(LLM_BACKENDS)):
+        backends.append(Backend(
+            spec.get("name") or f"backend-{i}",
+            spec.get("api_base") or default_base,
+            spec.get("api_key") or default_key,
+            float(spec.get("weight", 1.0)),
+            spec.get("models"),
+        ))
+    return backends
+
+
+class LLMRouter:
+    """
+    Spreads calls over the configured backends by weight, skipping those
+    whose circuit is open. For latency-critical priority classes a second
+    request may be hedged once the first has outlived its backend's p95 for
+    that class;
+    the hedge budget keeps that to LLM_HEDGE_MAX_RATIO of requests.
+    """
+
+    def __init__(self, backends: list):
+        self.backends = backends
+        self.hedgeable = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def pick(self, model: str, exclude=()):
+        """Weighted choice among available backends serving `model`, or None."""
+        candidates = [b for b in self.backends if b.serves(model) and b.available() and b not in exclude]
+        if not candidates:
+            return None
+        return random.choices(candidates, weights=[b.weight for b in candidates])[0]
+
+    def should_hedge(self, priority: str) -> bool:
+        if priority not in LLM_HEDGE_CLASSES:
+            return False
+        self.hedgeable += 1
+        return True
+
+    def take_hedge(self) -> bool:
+        if self.hedged + 1 > LLM_HEDGE_MAX_RATIO * self.hedgeable:
+            return False
+        self.hedged += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "hedgeable": self.hedgeable,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "backends": {b.name: b.stats() for b in self.backends},
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from backend.utils.metrics_tool import CounterFunc, Gauge
+
+
+class LLMOverloadedError(Exception):
+    """Raised when a request is shed; `retry_after` is a hint in seconds."""
+
+    def __init__(self, priority: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"LLM {priority} work {reason}")
+        self.priority = priority
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class PriorityClass:
+    def __init__(self, name: str, rank: int, concurrency: int, queue: int, deadline: float):
+        env = name.upper()
+        self.name = name
+        self.rank = rank                 # lower runs first
+        self.concurrency = int(os.getenv(f"LLM_LIMIT_{env}", str(concurrency)))
+        self.max_queue = int(os.getenv(f"LLM_QUEUE_{env}", str(queue)))
+        self.deadline = float(os.getenv(f"LLM_DEADLINE_{env}", str(deadline)))   # max seconds queued
+        self.active = 0
+        self.waiters = deque()
+        self.avg_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+
+LLM_GLOBAL_CONCURRENCY = int(os.getenv("LLM_GLOBAL_CONCURRENCY", "12"))
+LLM_INTERACTIVE_RESERVE = int(os.getenv("LLM_INTERACTIVE_RESERVE", "2"))   # global slots background work may not take
+INTERACTIVE_RANK = 1                                                       # completion and terminology
+
+PRIORITY_CLASSES = [
+    # name, rank, concurrency, queue, deadline
+    ("completion", 0, 8, 16, 2.0),
+    ("terminology", 1, 4, 32, 5.0),
+    ("draft", 2, 4, 16, 15.0),
+    ("summary", 3, 2, 8, 30.0),
+    ("chat", 4, 4, 16, 60.0),
+]
+
+
+class LLMScheduler:
+    """
+    Admission control in front of every upstream LLM call. Work is tagged
+    with a priority class; each class has its own concurrency limit and
+    bounded queue, all classes share LLM_GLOBAL_CONCURRENCY slots, and
+    freed slots go to the highest-priority waiter. Background classes
+    leave LLM_INTERACTIVE_RESERVE slots to interactive ones. Work that
+    waits past its class deadline is dropped, as is work arriving at a
+    full queue; both raise LLMOverloadedError with a Retry-After hint.
+    """
+
+    def __init__(self, classes=PRIORITY_CLASSES, global_limit: int = LLM_GLOBAL_CONCURRENCY,
+                 reserve: int = LLM_INTERACTIVE_RESERVE):
+        self.classes = {c[0]: PriorityClass(*c) for c in classes}
+        self.ordered = sorted(self.classes.values(), key=lambda c: c.rank)
+        self.global_limit = global_limit
+        self.reserve = min(reserve, max(0, global_limit - 1))
+        self.total_active = 0
+
+    def _get(self, priority: str) -> PriorityClass:
+        return self.classes.get(priority) or self.ordered[-1]
+
+    def _can_start(self, pc: PriorityClass) -> bool:
+        limit = self.global_limit - (self.reserve if pc.rank > INTERACTIVE_RANK else 0)
+        return pc.active < pc.concurrency and self.total_active < limit
+
+    def _start(self, pc: PriorityClass):
+        pc.active += 1
+        pc.admitted += 1
+        self.total_active += 1
+
+    def _wake(self):
+        for pc in self.ordered:
+            while pc.waiters and self._can_start(pc):
+                future = pc.waiters.popleft()
+                if future.done():
+                    continue
+                self._start(pc)
+                future.set_result(True)
+
+    def retry_after(self, pc: PriorityClass) -> float:
+        backlog = len(pc.waiters) + pc.active
+        return float(max(1, math.ceil(pc.avg_seconds * backlog / max(1, pc.concurrency))))
+
+    async def acquire(self, priority: str, deadline: float = None):
+        pc = self._get(priority)
+        # Waiters of higher classes that could start were already woken on release.
+        if not pc.waiters and self._can_start(pc):
+            self._start(pc)
+            return pc
+
+        if len(pc.waiters) >= pc.max_queue:
+            pc.rejected += 1
+            raise LLMOverloadedError(pc.name, "queue full", self.retry_after(pc))
+
+        future = asyncio.get_running_loop().create_future()
+        pc.waiters.append(future)
+        timeout = pc.deadline if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(pc)
+            else:
+                self._abandon(pc, future)
+            raise
+
+        if future.done():
+            return pc
+        self._abandon(pc, future)
+        pc.expired += 1
+        raise LLMOverloadedError(pc.name, "expired in queue", self.retry_after(pc))
+
+    def _abandon(self, pc: PriorityClass, future):
+        future.cancel()
+        try:
+            pc.waiters.remove(future)
+        except ValueError:
+            pass
+
+    def release(self, pc: PriorityClass, seconds: float = None):
+        pc.active -= 1
+        self.total_active -= 1
+        if seconds is not None:
+            pc.avg_seconds = 0.8 * pc.avg_seconds + 0.2 * seconds
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: str, deadline: float = None):
+        pc = await self.acquire(priority, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(pc, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        return {
+            "global_limit": self.global_limit,
+            "active": self.total_active,
+            "classes": {
+                pc.name: {
+                    "active": pc.active, "queued": len(pc.waiters),
+                    "limit": pc.concurrency, "max_queue": pc.max_queue, "deadline": pc.deadline,
+                    "admitted": pc.admitted, "rejected": pc.rejected, "expired": pc.expired,
+                    "avg_seconds": round(pc.avg_seconds, 3),
+                }
+                for pc in self.ordered
+            },
+        }
+
+
+llm_scheduler = LLMScheduler()
+
+_active = Gauge("medcopilot_llm_scheduler_active", "LLM calls holding a scheduler slot.", ("priority",))
+_queued = Gauge("medcopilot_llm_scheduler_queued", "LLM calls waiting for a scheduler slot.", ("priority",))
+_shed = CounterFunc("medcopilot_llm_scheduler_shed_total", "LLM calls shed by admission control.", ("priority", "reason"))
+for _pc in llm_scheduler.ordered:
+    _active.track(lambda pc=_pc: pc.active, priority=_pc.name)
+    _queued.track(lambda pc=_pc: len(pc.waiters), priority=_pc.name)
+    _shed.track(lambda pc=_pc: pc.rejected, priority=_pc.name, reason="queue_full")
+    _shed.track(lambda pc=_pc: pc.expired, priority=_pc.name, reason="expired")
+Gauge("medcopilot_llm_saturation", "Share of global LLM slots in use.").track(
+    lambda: llm_scheduler.total_active / llm_scheduler.global_limit)
+
+
+async def overloaded_handler(request, exc: LLMOverloadedError):
+    """FastAPI exception handler: shed work becomes 429 with Retry-After."""
+    from fastapi.responses import JSONResponse
+
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "priority": exc.priority, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(int(math.ceil(exc.retry_after)))},
+    )
@@ -0,0 +1,225 @@
+import bisect
+import threading
+import time
+
+# Seconds; covers keystroke completions (tens of ms) up to long summaries.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def samples(self):
+        """Yields (suffix, label_values, extra_label, value)."""
+        return []
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.label_names, values, extra)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [("", key, "", value) for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+    """
+    Set directly, or computed at scrape time by callbacks registered with
+    track(); a callback returning None contributes no sample.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}
+        self.callbacks = []
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def track(self, fn, **labels):
+        self.callbacks.append((self._key(labels), fn))
+
+    def samples(self):
+        with self.lock:
+            samples = [("", key, "", value) for key, value in self.values.items()]
+        for key, fn in self.callbacks:
+            try:
+                value = fn()
+                if value is not None:
+                    samples.append(("", key, "", value))
+            except Exception as e:
+                print(f"[Metrics] {self.name} callback failed: {e}")
+        return samples
+
+
+class CounterFunc(Gauge):
+    """A counter whose value is read from an existing stats() counter at scrape time."""
+
+    kind = "counter"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}                 # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(entry)) for key, entry in self.values.items()]
+        samples = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                samples.append(("_bucket", key, f'le="{_number(bound)}"', cumulative))
+            samples.append(("_bucket", key, 'le="+Inf"', entry[-1]))
+            samples.append(("_sum", key, "", entry[-2]))
+            samples.append(("_count", key, "", entry[-1]))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.histogram.observe(self.seconds, **self.labels)
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- metrics shared by several modules ---
+
+http_request_seconds = Histogram(
+    "medcopilot_http_request_duration_seconds", "HTTP request latency (until the last body chunk).",
+    ("service", "method", "route", "status"))
+agent_seconds = Histogram(
+    "medcopilot_agent_duration_seconds", "Agent operation latency, including cache hits.",
+    ("agent", "operation"))
+cache_hits = CounterFunc("medcopilot_cache_hits_total", "Cache hits.", ("cache",))
+cache_misses = CounterFunc("medcopilot_cache_misses_total", "Cache misses.", ("cache",))
+cache_hit_ratio = Gauge("medcopilot_cache_hit_ratio", "Cache hit ratio since process start.", ("cache",))
+
+
+def track_cache(name: str, stats_fn):
+    """Exports hits, misses and hit ratio from a stats() dict; stats_fn may return None."""
+    def ratio():
+        stats = stats_fn()
+        if stats is None:
+            return None
+        lookups = stats["hits"] + stats["misses"]
+        return stats["hits"] / lookups if lookups else 0.0
+
+    cache_hits.track(lambda: (stats_fn() or {}).get("hits"), cache=name)
+    cache_misses.track(lambda: (stats_fn() or {}).get("misses"), cache=name)
+    cache_hit_ratio.track(ratio, cache=name)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template."""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "other"
+            http_request_seconds.observe(time.perf_counter() - start, service=self.service,
+                                         method=scope["method"], route=route, status=status[0])
+
+
+def metrics_response():
+    from fastapi.responses import PlainTextResponse
+
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
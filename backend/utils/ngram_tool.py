@@ -0,0 +1,140 @@
+import asyncio
+import glob
+import json
+import os
+import threading
+from collections import Counter, defaultdict
+
+NGRAM_COMPLETION = os.getenv("NGRAM_COMPLETION", "1") == "1"
+NGRAM_REFRESH_SECONDS = float(os.getenv("NGRAM_REFRESH_SECONDS", "300"))
+NGRAM_RECORDS_DIR = os.getenv("NGRAM_RECORDS_DIR", "backend/data/output")
+NGRAM_ORDER = int(os.getenv("NGRAM_ORDER", "6"))                    # longest context, in characters
+NGRAM_MIN_COUNT = int(os.getenv("NGRAM_MIN_COUNT", "3"))            # observations a context needs to be trusted
+NGRAM_MIN_PROB = float(os.getenv("NGRAM_MIN_PROB", "0.6"))          # per-character
+NGRAM_MIN_CONFIDENCE = float(os.getenv("NGRAM_MIN_CONFIDENCE", "0.5"))  # whole completion
+NGRAM_MIN_CHARS = int(os.getenv("NGRAM_MIN_CHARS", "2"))
+NGRAM_MAX_CHARS = int(os.getenv("NGRAM_MAX_CHARS", "10"))
+NGRAM_SUMMARY_WEIGHT = float(os.getenv("NGRAM_SUMMARY_WEIGHT", "2"))
+
+RECORD_FIELDS = ['main_complaint', 'history_present_illness', 'past_history', 'physical_exam',
+                 'auxiliary_exam', 'diagnosis', 'orders']
+
+END = "\x03"
+STOP_CHARS = "，。；！？,;!?\n"
+
+
+def count_ngrams(text: str, order: int, table=None):
+    """context (0..order chars) -> Counter of the next character."""
+    table = table if table is not None else defaultdict(Counter)
+    text = text + END
+    for i, ch in enumerate(text):
+        for n in range(0, min(order, i) + 1):
+            table[text[i - n:i]][ch] += 1
+    return table
+
+
+class NGramCompleter:
+    """
+    Character n-gram predictor over saved records, one table per field.
+    Completions are decoded greedily from the longest trusted context and
+    returned only when every step and the whole continuation are confident;
+    otherwise the caller falls back to the LLM. Records are added
+    incrementally: refresh() only reads files it has not seen yet.
+    """
+
+    def __init__(self, records_dir: str = NGRAM_RECORDS_DIR, order: int = NGRAM_ORDER):
+        self.records_dir = records_dir
+        self.order = order
+        self.tables = {field: defaultdict(Counter) for field in RECORD_FIELDS}
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self) -> int:
+        """Index records added since the last call; returns how many."""
+        added = 0
+        for path in sorted(glob.glob(os.path.join(self.records_dir, "*.json"))):
+            if path in self.seen:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except Exception as e:
+                print(f"[NGram] Skipping {path}: {e}")
+                self.seen.add(path)
+                continue
+            self.add_record(record)
+            self.seen.add(path)
+            added += 1
+        if added:
+            print(f"[NGram] Indexed {added} new records ({len(self.seen)} total)")
+        return added
+
+    def add_record(self, record: dict):
+        with self.lock:
+            for field in RECORD_FIELDS:
+                text = (record.get(field) or "").strip()
+                if text:
+                    count_ngrams(text, self.order, self.tables[field])
+
+    def _candidates(self, table, summary_table, context: str):
+        for n in range(min(self.order, len(context)), -1, -1):
+            key = context[len(context) - n:]
+            counts = Counter(table.get(key, {}))
+            if summary_table is not None and key in summary_table:
+                for ch, c in summary_table[key].items():
+                    counts[ch] += c * NGRAM_SUMMARY_WEIGHT
+            if n > 0 and sum(counts.values()) >= NGRAM_MIN_COUNT:
+                return counts
+        return None
+
+    def complete(self, field_id: str, text: str, summary: str = ""):
+        """Returns (completion, confidence); ("", 0.0) when not confident."""
+        table = self.tables.get(field_id)
+        if table is None or not text:
+            return "", 0.0
+
+        summary_table = count_ngrams(summary, self.order) if summary else None
+        completion = ""
+        confidence = 1.0
+        with self.lock:
+            while len(completion) < NGRAM_MAX_CHARS:
+                counts = self._candidates(table, summary_table, text + completion)
+                if not counts:
+                    break
+                ch, c = counts.most_common(1)[0]
+                p = c / sum(counts.values())
+                if p < NGRAM_MIN_PROB or ch == END or confidence * p < NGRAM_MIN_CONFIDENCE:
+                    break
+                completion += ch
+                confidence *= p
+                if ch in STOP_CHARS:
+                    break
+
+        if len(completion.strip()) < NGRAM_MIN_CHARS:
+            self.misses += 1
+            return "", 0.0
+        self.hits += 1
+        return completion, confidence
+
+    def stats(self) -> dict:
+        return {
+            "records": len(self.seen),
+            "contexts": sum(len(t) for t in self.tables.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+ngram_completer = NGramCompleter()
+
+
+async def refresh_periodically(interval: float = NGRAM_REFRESH_SECONDS):
+    """Background task: pick up newly saved records every `interval` seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(ngram_completer.refresh)
+        except Exception as e:
+            print(f"[NGram] Refresh error: {e}")
+        await asyncio.sleep(interval)
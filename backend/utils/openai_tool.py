@@ -1,14 +1,22 @@
-import numpy as np
 import openai
 import traceback
-import time
+import asyncio
+import random
+import hashlib
+import httpx
 import json
-import re
+import os
+import time
+
+from backend.utils.llm_scheduler import llm_scheduler, LLMOverloadedError
+from backend.utils.llm_router import LLMRouter, load_backends
+from backend.utils.metrics_tool import Counter, CounterFunc, Histogram, track_cache
+from backend.utils.trace_tool import record_span, span, trace_headers
 
 
 DEBUG = False
 
-openai.api_key = "sk-..." 
+openai.api_key = "sk-..."
 openai.api_base = "..."
 
 openai.proxy = {
@@ -16,34 +24,412 @@ openai.proxy = {
     "https": None
 }
 
+SUPPORTED_MODELS = ["gpt-3.5-turbo", 'gpt-4', "gpt-4-turbo-2024-04-09", "gpt-4o-2024-05-13", 'gpt-4o-2024-11-20', 'gpt-4o', 'gpt-4o-2024-08-06']
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = max(1, int(os.getenv("LLM_MAX_RETRIES", "3")))       # attempts, including the first
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") == "1"     # share identical in-flight calls
+
+LLM_CACHE = os.getenv("LLM_CACHE", "0") == "1"                      # opt-in: answers may carry patient dialogue
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "backend/data/cache/llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_MAX_AGE = float(os.getenv("LLM_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"        # skip lookups but keep refreshing entries
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+llm_router = LLMRouter(load_backends(openai.api_base, openai.api_key))
+
+# `agent` is the scheduler priority class, which names the calling agent.
+llm_request_seconds = Histogram(
+    "medcopilot_llm_request_duration_seconds", "Upstream LLM attempt latency; time to first token for streams.",
+    ("agent", "model", "backend", "outcome"))
+llm_tokens = Counter("medcopilot_llm_tokens_total", "Tokens reported by upstream usage.", ("agent", "model", "kind"))
+
+_http_client = None
+_llm_cache = None
+
+
+class LLMError(Exception):
+    pass
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """One pooled keep-alive client per process, shared by every agent."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE
+            ),
+            trust_env=False,
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+def parse_json_response(response: str):
+    """json.loads a model reply, tolerating ```json fences around it."""
+    with span("json_parse"):
+        response = response.strip()
+        if "```json" in response:
+            response = response.split("```json")[1].split("```")[0].strip()
+        elif "```" in response:
+            response = response.split("```")[1].split("```")[0].strip()
+        return json.loads(response)
+
+
+def get_llm_cache():
+    """The shared response cache (see open_shared_cache), or None when disabled or unusable."""
+    global _llm_cache, LLM_CACHE
+    if _llm_cache is None and LLM_CACHE:
+        from backend.utils.cache_tool import open_shared_cache
+        try:
+            _llm_cache = open_shared_cache("llm", LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE, path=LLM_CACHE_PATH)
+        except Exception as e:
+            print(f"LLM cache disabled: {e}")
+            LLM_CACHE = False
+    return _llm_cache
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one task. Callers await
+    it through asyncio.shield, so one caller going away does not cancel the
+    upstream request for the others; once the last waiter is gone the
+    upstream task is cancelled too.
+    """
+
+    def __init__(self):
+        self.calls = {}                  # key -> [task, waiters]
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key, fn):
+        entry = self.calls.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            entry = [task, 0]
+            self.calls[key] = entry
+            task.add_done_callback(lambda t: self.calls.pop(key, None) if self.calls.get(key) is entry else None)
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not entry[0].done():
+                entry[0].cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            entry[1] -= 1
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self.calls), "upstream_calls": self.leaders,
+                "coalesced": self.coalesced, "abandoned": self.abandoned}
+
+
+llm_flight = SingleFlight()
+CounterFunc("medcopilot_llm_coalesced_total", "LLM calls answered by an identical in-flight call.").track(
+    lambda: llm_flight.coalesced)
+# Scrapes must not open (and create) the cache file: report only once it is in use.
+track_cache("llm", lambda: _llm_cache.stats() if _llm_cache is not None else None)
 
-class GetOpenAI:
-    @staticmethod
-    def __gpt_api_stream(messages: list, model='gpt-4'):
+
+def request_key(model: str, messages: list) -> str:
+    payload = json.dumps({"model": model, "messages": messages}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def backoff_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter.
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+class AsyncGetOpenAI:
+    """
+    asyncio-native replacement for the old blocking openai.ChatCompletion
+    wrapper. Talks to the OpenAI-compatible /chat/completions endpoints
+    chosen by llm_router over a shared connection pool.
+    """
+
+    async def __gpt_api(self, backend, messages: list, model='gpt-4', n=1, agent="chat"):
+        """
+        Returns (success, content_or_error, retryable). With n > 1 the
+        content is the list of all n choices.
+        """
         completion = {'role': '', 'content': ''}
+        payload = {"model": backend.upstream_model(model), "messages": messages, "stream": False}
+        if n > 1:
+            payload["n"] = n
         try:
-            response = openai.ChatCompletion.create(
-                model=model,
-                messages=messages,
-                stream=False,
+            response = await get_http_client().post(
+                backend.url,
+                headers={"Authorization": f"Bearer {backend.api_key}", **trace_headers()},
+                json=payload,
             )
+            if response.status_code != 200:
+                return (False, f'OpenAI API 异常: HTTP {response.status_code} {response.text[:200]}',
+                        response.status_code in RETRYABLE_STATUS)
 
-            msg = response.choices[0].message.content
-            return (True, msg)
+            data = response.json()
+            usage = data.get("usage") or {}
+            llm_tokens.inc(usage.get("prompt_tokens", 0), agent=agent, model=model, kind="prompt")
+            llm_tokens.inc(usage.get("completion_tokens", 0), agent=agent, model=model, kind="completion")
+            choices = data["choices"]
+            if n > 1:
+                return (True, [c["message"]["content"] for c in choices], False)
+            msg = choices[0]["message"]["content"]
+            return (True, msg, False)
+        except (httpx.TimeoutException, httpx.TransportError) as err:
+            if DEBUG:
+                print(f"{traceback.format_exc()}")
+            return (False, f'OpenAI API 异常: {err!r} {completion}', True)
         except Exception as err:
             if DEBUG:
                 print(f"{traceback.format_exc()}")
-            return (False, f'OpenAI API 异常: {err} {completion}')
-
-    def get_respons(self, input_msg, model="gpt-3.5-turbo"):
-        assert model in ["gpt-3.5-turbo", 'gpt-4', "gpt-4-turbo-2024-04-09", "gpt-4o-2024-05-13", 'gpt-4o-2024-11-20', 'gpt-4o', 'gpt-4o-2024-08-06']
-        messages = [{"role": "system", "content": "You are a helpful assistant."},
-                    {'role': 'user', 'content': input_msg}]
-        for _ in range(3):
-            ret, out_msg = self.__gpt_api_stream(messages, model=model)
-            if ret:
-                break
+            return (False, f'OpenAI API 异常: {err} {completion}', False)
+
+    def _messages(self, input_msg):
+        return [{"role": "system", "content": "You are a helpful assistant."},
+                {'role': 'user', 'content': input_msg}]
+
+    async def get_respons(self, input_msg, model="gpt-3.5-turbo", cache_version=None, bypass_cache=False,
+                          priority="chat"):
+        """
+        Returns (success, content). Passing `cache_version` (the prompt
+        template's version tag) makes successful answers persist in the
+        on-disk cache under (model, version, prompt hash); `bypass_cache`
+        forces a fresh call and overwrites the stored answer. Upstream calls
+        are admitted by llm_scheduler under `priority` and may raise
+        LLMOverloadedError.
+        """
+        assert model in SUPPORTED_MODELS
+        messages = self._messages(input_msg)
+        key = request_key(model, messages)
+
+        cache = get_llm_cache() if cache_version else None
+        cache_key = f"{model}:{cache_version}:{key}"
+        if cache is not None and not (bypass_cache or LLM_CACHE_BYPASS):
+            try:
+                with span("llm.cache"):
+                    cached = await asyncio.to_thread(cache.get, cache_key)
+                if cached is not None:
+                    return True, cached
+            except Exception as e:
+                print(f"LLM cache read error: {e}")
+
+        if LLM_SINGLE_FLIGHT:
+            ret, out_msg = await llm_flight.do(key, lambda: self._scheduled_call(priority, messages, model))
+        else:
+            ret, out_msg = await self._scheduled_call(priority, messages, model)
+
+        if ret and cache is not None:
+            try:
+                await asyncio.to_thread(cache.set, cache_key, out_msg)
+            except Exception as e:
+                print(f"LLM cache write error: {e}")
+        return ret, out_msg
+
+    async def get_choices(self, input_msg, model="gpt-3.5-turbo", n=1, priority="completion"):
+        """(success, [content, ...]) with `n` sampled choices from one request."""
+        assert model in SUPPORTED_MODELS
+        ret, out_msg = await self._scheduled_call(priority, self._messages(input_msg), model, n=n)
+        if not ret:
+            return ret, out_msg
+        return ret, out_msg if isinstance(out_msg, list) else [out_msg]
+
+    async def _scheduled_call(self, priority: str, messages: list, model: str, n: int = 1):
+        queued = time.perf_counter()
+        async with llm_scheduler.slot(priority):
+            record_span("llm.queue", queued, time.perf_counter(), priority=priority)
+            return await self._call_with_retries(messages, model, n=n, hedge=llm_router.should_hedge(priority),
+                                                 agent=priority)
+
+    async def _call_with_retries(self, messages: list, model: str, n: int = 1, hedge: bool = False, agent="chat"):
+        """Retries fail over to another backend at once; the same backend is retried after a backoff."""
+        tried = []
+        for attempt in range(LLM_MAX_RETRIES):
+            backend = llm_router.pick(model, exclude=tried)
+            if backend is None:
+                backend = llm_router.pick(model)
+                if backend is None:
+                    return False, 'OpenAI API 异常: no LLM backend available (circuit open)'
+                if attempt > 0:
+                    await asyncio.sleep(backoff_delay(attempt - 1))
+            if hedge:
+                ret, out_msg, retryable = await self._hedged(backend, tried, messages, model, n, agent)
             else:
-                time.sleep(1)
+                ret, out_msg, retryable = await self._attempt(backend, messages, model, n, agent)
+            if ret or not retryable:
+                break
+            tried.append(backend)
 
         return ret, out_msg
+
+    async def _attempt(self, backend, messages: list, model: str, n: int = 1, agent="chat"):
+        backend.begin()
+        start = time.monotonic()
+        try:
+            with span("llm", backend=backend.name, model=model):
+                ret, out_msg, retryable = await self.__gpt_api(backend, messages, model=model, n=n, agent=agent)
+        except asyncio.CancelledError:
+            backend.failure(counts=False)
+            llm_request_seconds.observe(time.monotonic() - start, agent=agent, model=model,
+                                        backend=backend.name, outcome="cancelled")
+            raise
+        seconds = time.monotonic() - start
+        if ret:
+            backend.success(seconds, agent)
+        else:
+            backend.failure(counts=retryable)
+        llm_request_seconds.observe(seconds, agent=agent, model=model, backend=backend.name,
+                                    outcome="ok" if ret else "error")
+        return ret, out_msg, retryable
+
+    async def _hedged(self, backend, tried: list, messages: list, model: str, n: int = 1, agent="chat"):
+        """
+        Sends to `backend`; if no answer arrives within its p95 latency for
+        this priority class, sends a duplicate (to another backend when one
+        is available) and takes whichever succeeds first, cancelling the
+        other. The hedge backend is added to `tried` so a retry skips it.
+        """
+        tasks = [asyncio.ensure_future(self._attempt(backend, messages, model, n, agent))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=backend.hedge_delay(agent))
+            if done or not llm_router.take_hedge():
+                return await tasks[0]
+
+            second = llm_router.pick(model, exclude=[backend, *tried]) or backend
+            if second is not backend:
+                tried.append(second)
+            tasks.append(asyncio.ensure_future(self._attempt(second, messages, model, n, agent)))
+            pending, result = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result[0]:
+                        if task is tasks[1]:
+                            llm_router.hedge_wins += 1
+                        return result
+            return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def stream_respons(self, input_msg, model="gpt-3.5-turbo", priority="chat"):
+        """
+        Async generator of content deltas (stream=True). Connection failures
+        before the first token are retried like get_respons; raises LLMError
+        once retries are exhausted or if the stream breaks midway. Holds a
+        `priority` scheduler slot for the whole stream.
+        """
+        assert model in SUPPORTED_MODELS
+        queued = time.perf_counter()
+        async with llm_scheduler.slot(priority):
+            record_span("llm.queue", queued, time.perf_counter(), priority=priority)
+            async for delta in self._stream(input_msg, model, priority):
+                yield delta
+
+    async def _stream(self, input_msg, model, agent="chat"):
+        """Backend latency for streams is time to first token; failover as in _call_with_retries."""
+        messages = self._messages(input_msg)
+        last_error = None
+        tried = []
+
+        for attempt in range(LLM_MAX_RETRIES):
+            backend = llm_router.pick(model, exclude=tried)
+            if backend is None:
+                backend = llm_router.pick(model)
+                if backend is None:
+                    raise LLMError('OpenAI API 异常: no LLM backend available (circuit open)')
+                if attempt > 0:
+                    await asyncio.sleep(backoff_delay(attempt - 1))
+            tried.append(backend)
+
+            payload = {"model": backend.upstream_model(model), "messages": messages, "stream": True}
+            started = False
+            backend.begin()
+            start = time.monotonic()
+            traced_start = time.perf_counter()
+            try:
+                async with get_http_client().stream(
+                    "POST",
+                    backend.url,
+                    headers={"Authorization": f"Bearer {backend.api_key}", **trace_headers()},
+                    json=payload,
+                ) as response:
+                    if response.status_code != 200:
+                        body = (await response.aread()).decode("utf-8", errors="ignore")
+                        last_error = f"HTTP {response.status_code} {body[:200]}"
+                        retryable = response.status_code in RETRYABLE_STATUS
+                        backend.failure(counts=retryable)
+                        llm_request_seconds.observe(time.monotonic() - start, agent=agent, model=model,
+                                                    backend=backend.name, outcome="error")
+                        if not retryable:
+                            break
+                        continue
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        choices = json.loads(data).get("choices") or []
+                        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                        if delta:
+                            if not started:
+                                started = True
+                                backend.success(time.monotonic() - start, agent)
+                                llm_request_seconds.observe(time.monotonic() - start, agent=agent, model=model,
+                                                            backend=backend.name, outcome="ok")
+                                record_span("llm.first_token", traced_start, time.perf_counter(),
+                                            backend=backend.name, model=model)
+                            yield delta
+                    if not started:
+                        backend.success(time.monotonic() - start, agent)
+                    return
+            except (httpx.TimeoutException, httpx.TransportError) as err:
+                if DEBUG:
+                    print(f"{traceback.format_exc()}")
+                if started:
+                    raise LLMError(f'OpenAI API 异常: stream interrupted {err!r}')
+                backend.failure()
+                llm_request_seconds.observe(time.monotonic() - start, agent=agent, model=model,
+                                            backend=backend.name, outcome="error")
+                last_error = repr(err)
+            except Exception as err:
+                # Malformed chunks (bad JSON, unexpected shape) end the stream with an LLMError too.
+                if DEBUG:
+                    print(f"{traceback.format_exc()}")
+                if started:
+                    raise LLMError(f'OpenAI API 异常: malformed stream {err!r}') from err
+                backend.failure()
+                llm_request_seconds.observe(time.monotonic() - start, agent=agent, model=model,
+                                            backend=backend.name, outcome="error")
+                last_error = f"malformed stream {err!r}"
+            except BaseException:
+                if not started:
+                    backend.failure(counts=False)
+                raise
+
+        raise LLMError(f'OpenAI API 异常: {last_error}')
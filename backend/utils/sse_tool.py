@@ -0,0 +1,15 @@
+import json
+
+
+def sse_event(data, event: str = None) -> str:
+    """Format one server-sent event. `data` is JSON-encoded."""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
@@ -0,0 +1,129 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+SENTENCE_DELIMITERS = "，。；、！？,;!?\n"
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    (start, end) of every sentence, split on the same punctuation the LLM
+    prompt uses. `end` excludes the delimiter; empty sentences are dropped.
+    """
+    spans = []
+    start = 0
+    for i, ch in enumerate(text):
+        if ch in SENTENCE_DELIMITERS:
+            if text[start:i].strip():
+                spans.append((start, i))
+            start = i + 1
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton over a colloquial -> standard lexicon.
+
+    Matching is leftmost-longest over the lexicon *and* the protected terms,
+    so a protected term (e.g. "呕吐") swallows any shorter colloquial entry
+    inside it ("吐") and is itself never reported.
+
+    Ambiguous entries (every single character, plus `ambiguous`) depend on
+    context ("同时复查" is not "伴复查"): they are reported as issues but
+    never rewritten by apply().
+    """
+
+    def __init__(self, mapping: Dict[str, str], protected: Iterable[str] = (), ambiguous: Iterable[str] = ()):
+        self.ambiguous = {term for term in mapping if len(term) == 1} | set(ambiguous)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]           # per state: (length, replacement) of patterns ending here
+        for term in protected:
+            self._add(term, None)
+        for term, replacement in mapping.items():
+            if term != replacement:
+                self._add(term, replacement)
+        self._build()
+
+    def _add(self, term: str, replacement: Optional[str]):
+        if not term:
+            return
+        state = 0
+        for ch in term:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        # A protected spelling wins over a lexicon entry with the same text.
+        if not any(length == len(term) for length, _ in self.output[state]):
+            self.output[state].append((len(term), replacement))
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def _raw_matches(self, text: str) -> List[Tuple[int, int, Optional[str]]]:
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length, replacement in self.output[state]:
+                matches.append((i + 1 - length, i + 1, replacement))
+        return matches
+
+    def find(self, text: str) -> List[Tuple[int, int, Optional[str]]]:
+        """
+        Non-overlapping leftmost-longest matches as (start, end, replacement);
+        replacement is None for protected terms.
+        """
+        matches = self._raw_matches(text)
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+
+        chosen = []
+        covered = 0
+        for start, end, replacement in matches:
+            if start >= covered:
+                chosen.append((start, end, replacement))
+                covered = end
+        return chosen
+
+    def issues(self, text: str) -> List[Dict]:
+        return [
+            {"original": text[start:end], "suggestion": replacement, "start": start, "end": end}
+            for start, end, replacement in self.find(text)
+            if replacement is not None
+        ]
+
+    def replacements(self, text: str) -> List[Tuple[int, int, str]]:
+        """Matches that are safe to rewrite without context."""
+        return [
+            (start, end, replacement) for start, end, replacement in self.find(text)
+            if replacement is not None and text[start:end] not in self.ambiguous
+        ]
+
+    def apply(self, text: str) -> str:
+        """Rewrites unambiguous entries only; ambiguous ones are left for review."""
+        parts = []
+        pos = 0
+        for start, end, replacement in self.replacements(text):
+            parts.append(text[pos:start])
+            parts.append(replacement)
+            pos = end
+        parts.append(text[pos:])
+        return "".join(parts)
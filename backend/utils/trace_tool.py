@@ -0,0 +1,180 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+TRACING = os.getenv("TRACING", "1") == "1"
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "200"))            # finished traces kept for /api/traces
+TRACE_DUMP_PATH = os.getenv("TRACE_DUMP_PATH", "")          # append finished traces as JSON lines
+TRACE_HEADER = "x-trace-id"
+
+_current = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("span_parent", default=None)
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+_dump_lock = threading.Lock()
+
+
+class Trace:
+    """Spans recorded for one request (or one background job) in this process."""
+
+    def __init__(self, trace_id: str, service: str, name: str):
+        self.trace_id = trace_id
+        self.service = service
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.finished = None
+        self.spans = []                  # (name, start offset, duration, parent, attrs)
+        self.attrs = {}
+
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def add(self, name: str, start: float, duration: float, parent=None, attrs=None):
+        self.spans.append((name, start - self.started, duration, parent, attrs or {}))
+
+    def server_timing(self) -> str:
+        """Spans summed by name, in first-seen order, plus the elapsed total."""
+        totals = OrderedDict()
+        for name, _, duration, _, _ in list(self.spans):
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + duration)
+        parts = [f'{name};dur={total * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+                 for name, (count, total) in totals.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "service": self.service,
+            "name": self.name,
+            "started_at": self.wall_started,
+            "duration_ms": round(self.elapsed() * 1000, 2),
+            **self.attrs,
+            "spans": [
+                {"name": name, "start_ms": round(start * 1000, 2), "duration_ms": round(duration * 1000, 2),
+                 "parent": parent, **({"attrs": attrs} if attrs else {})}
+                for name, start, duration, parent, attrs in list(self.spans)
+            ],
+        }
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace():
+    return _current.get()
+
+
+def trace_headers() -> dict:
+    """Headers that carry the current trace id to another service."""
+    trace = _current.get()
+    return {TRACE_HEADER: trace.trace_id} if trace is not None else {}
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the block as a span of the current trace; a no-op outside one."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    parent = _parent.get()
+    token = _parent.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _parent.reset(token)
+        trace.add(name, start, time.perf_counter() - start, parent, attrs)
+
+
+def record_span(name: str, start: float, end: float, **attrs):
+    """Adds a span timed elsewhere (perf_counter timestamps), e.g. in an executor."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, end - start, _parent.get(), attrs)
+
+
+def _finish(trace: Trace):
+    trace.finished = time.perf_counter()
+    with _recent_lock:
+        _recent[trace.trace_id] = trace
+        while len(_recent) > TRACE_KEEP:
+            _recent.popitem(last=False)
+    if TRACE_DUMP_PATH:
+        line = json.dumps(trace.to_dict(), ensure_ascii=False)
+        with _dump_lock, open(TRACE_DUMP_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def start_trace(name: str, service: str, trace_id: str = None):
+    """Runs the block under a new trace (for work no request started, e.g. websocket jobs)."""
+    if not TRACING:
+        yield None
+        return
+    trace = Trace(trace_id or new_trace_id(), service, name)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        _finish(trace)
+
+
+def get_trace(trace_id: str):
+    with _recent_lock:
+        trace = _recent.get(trace_id)
+    return trace.to_dict() if trace is not None else None
+
+
+def recent_traces(limit: int = 50) -> list:
+    with _recent_lock:
+        traces = list(_recent.values())[-limit:]
+    return [{"trace_id": t.trace_id, "name": t.name, **t.attrs,
+             "duration_ms": round(t.elapsed() * 1000, 2)} for t in reversed(traces)]
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware that opens a trace per HTTP request. The id comes from
+    the client's X-Trace-Id header (or is generated) and is echoed back with
+    a Server-Timing header of the spans finished before the response
+    started. The trace kept for /api/traces covers the whole response,
+    including the rest of a stream.
+    """
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING:
+            return await self.app(scope, receive, send)
+
+        trace_id = None
+        for key, value in scope.get("headers") or []:
+            if key == TRACE_HEADER.encode():
+                trace_id = value.decode("latin-1")[:64] or None
+                break
+
+        with start_trace(f'{scope["method"]} {scope["path"]}', self.service, trace_id) as trace:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    trace.attrs["status"] = message["status"]
+                    headers = list(message.get("headers") or [])
+                    headers.append((TRACE_HEADER.encode(), trace.trace_id.encode()))
+                    headers.append((b"server-timing", trace.server_timing().encode()))
+                    headers.append((b"timing-allow-origin", b"*"))   # lets the page on :8000 see :8001 timings
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
@@ -0,0 +1,185 @@
+import os
+import threading
+
+import numpy as np
+
+from backend.utils.audio_tool import SAMPLE_RATE
+
+
+VAD_BACKEND = os.getenv("ASR_VAD", "energy")                  # energy | fsmn | off
+VAD_FRAME_MS = int(os.getenv("ASR_VAD_FRAME_MS", "30"))
+VAD_MARGIN_DB = float(os.getenv("ASR_VAD_MARGIN_DB", "12"))    # speech must exceed the noise floor by this much
+VAD_FLOOR_DB = float(os.getenv("ASR_VAD_FLOOR_DB", "-55"))     # never treat anything quieter as speech
+VAD_HANGOVER_MS = int(os.getenv("ASR_VAD_HANGOVER_MS", "300"))
+VAD_MIN_SPEECH_MS = int(os.getenv("ASR_VAD_MIN_SPEECH_MS", "200"))
+VAD_PAD_MS = int(os.getenv("ASR_VAD_PAD_MS", "150"))
+VAD_ENDPOINT_MS = int(os.getenv("ASR_VAD_ENDPOINT_MS", "600"))  # streaming: silence that closes a segment
+VAD_NOISE_WINDOW_MS = int(os.getenv("ASR_VAD_NOISE_WINDOW_MS", "10000"))
+
+
+class VADStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total_samples = 0
+        self.speech_samples = 0
+        self.skipped_requests = 0
+
+    def record(self, total: int = 0, speech: int = 0, skipped_request: bool = False):
+        with self.lock:
+            self.total_samples += total
+            self.speech_samples += speech
+            if skipped_request:
+                self.skipped_requests += 1
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            total = self.total_samples / SAMPLE_RATE
+            speech = self.speech_samples / SAMPLE_RATE
+            return {
+                "backend": VAD_BACKEND,
+                "total_seconds": round(total, 3),
+                "speech_seconds": round(speech, 3),
+                "skipped_seconds": round(max(0.0, total - speech), 3),
+                "skipped_ratio": round(1 - speech / total, 4) if total > 0 else 0.0,
+                "skipped_requests": self.skipped_requests,
+            }
+
+
+vad_stats = VADStats()
+
+
+class EnergyVAD:
+    """
+    Frame-energy detector with an adaptive noise floor. One instance per
+    stream: the floor is a low percentile of the last VAD_NOISE_WINDOW_MS of
+    frame energies, seeded at VAD_FLOOR_DB so the first seconds of a stream
+    are not judged against speech alone.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.frame = int(sample_rate * VAD_FRAME_MS / 1000)
+        self.window_frames = max(1, VAD_NOISE_WINDOW_MS // VAD_FRAME_MS)
+        self.history = np.full(self.window_frames // 10 + 1, VAD_FLOOR_DB, dtype=np.float64)
+        self.noise_db = VAD_FLOOR_DB
+        self.hangover_frames = VAD_HANGOVER_MS // VAD_FRAME_MS
+        self.min_speech_frames = max(1, VAD_MIN_SPEECH_MS // VAD_FRAME_MS)
+        self.pad = int(sample_rate * VAD_PAD_MS / 1000)
+
+    def frame_energy_db(self, audio: np.ndarray) -> np.ndarray:
+        n_frames = len(audio) // self.frame
+        if n_frames == 0:
+            return np.zeros(0, dtype=np.float32)
+        frames = audio[:n_frames * self.frame].reshape(n_frames, self.frame)
+        return 10.0 * np.log10(np.square(frames).mean(axis=1) + 1e-10)
+
+    def speech_mask(self, audio: np.ndarray) -> np.ndarray:
+        energies = self.frame_energy_db(audio)
+        if energies.size == 0:
+            return np.zeros(0, dtype=bool)
+
+        if len(energies) >= self.window_frames:
+            self.history = energies[-self.window_frames:]
+            self.noise_db = float(np.percentile(energies, 5))
+        else:
+            self.history = np.concatenate([self.history, energies])[-self.window_frames:]
+            self.noise_db = float(np.percentile(self.history, 5))
+
+        threshold = max(self.noise_db + VAD_MARGIN_DB, VAD_FLOOR_DB)
+        return energies > threshold
+
+    def speech_regions(self, audio: np.ndarray) -> list:
+        mask = self.speech_mask(audio)
+        if not mask.any():
+            return []
+
+        if self.hangover_frames:
+            kernel = np.ones(self.hangover_frames + 1, dtype=np.int32)
+            mask = np.convolve(mask.astype(np.int32), kernel)[:len(mask)] > 0
+
+        edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        keep = (ends - starts) >= self.min_speech_frames
+
+        regions = []
+        for start, end in zip(starts[keep], ends[keep]):
+            s = max(0, int(start) * self.frame - self.pad)
+            e = min(len(audio), int(end) * self.frame + self.pad)
+            if regions and s <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], max(regions[-1][1], e))
+            else:
+                regions.append((s, e))
+        return regions
+
+
+class FsmnVAD:
+    """funasr's fsmn-vad, loaded on first use. Offline (whole-array) only."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.model = None
+        self.lock = threading.Lock()
+
+    def _get_model(self):
+        with self.lock:
+            if self.model is None:
+                from funasr import AutoModel
+                self.model = AutoModel(model="fsmn-vad", device="cpu", disable_update=True)
+        return self.model
+
+    def speech_regions(self, audio: np.ndarray) -> list:
+        if audio.size == 0:
+            return []
+        res = self._get_model().generate(input=audio, fs=self.sample_rate, disable_pbar=True)
+        if not res:
+            return []
+
+        scale = self.sample_rate / 1000.0
+        regions = []
+        for begin_ms, end_ms in res[0].get("value", []):
+            s = max(0, int(begin_ms * scale))
+            e = min(len(audio), int(end_ms * scale)) if end_ms >= 0 else len(audio)
+            if e > s:
+                regions.append((s, e))
+        return regions
+
+
+_fsmn_vad = None
+
+
+def get_offline_vad():
+    global _fsmn_vad
+    if VAD_BACKEND == "off":
+        return None
+    if VAD_BACKEND == "fsmn":
+        if _fsmn_vad is None:
+            _fsmn_vad = FsmnVAD()
+        return _fsmn_vad
+    return EnergyVAD()
+
+
+def get_streaming_vad():
+    # fsmn-vad is only used offline; streams always use the energy detector.
+    if VAD_BACKEND == "off":
+        return None
+    return EnergyVAD()
+
+
+def gate_audio(audio: np.ndarray) -> np.ndarray:
+    """
+    Keep only the speech regions of a whole clip (trimming leading/trailing
+    silence). Returns an empty array when the clip contains no speech.
+    """
+    vad = get_offline_vad()
+    if vad is None or audio.size == 0:
+        return audio
+
+    regions = vad.speech_regions(audio)
+    if not regions:
+        vad_stats.record(total=len(audio), skipped_request=True)
+        return audio[:0]
+
+    speech = np.concatenate([audio[s:e] for s, e in regions])
+    vad_stats.record(total=len(audio), speech=len(speech))
+    return speech
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+from backend.utils.openai_tool import get_http_client
+
+AGENT_SERVICE_URL = os.getenv("AGENT_SERVICE_URL", "http://127.0.0.1:8001")
+# Every agent-service worker; set by backend.supervisor. Sessions live in one worker's memory,
+# so each client (browser tab, consultation socket) sticks to the worker it picked.
+AGENT_SERVICE_URLS = [u.strip().rstrip("/") for u in os.getenv("AGENT_SERVICE_URLS", AGENT_SERVICE_URL).split(",") if u.strip()]
+AGENT_READY_TTL = float(os.getenv("AGENT_READY_TTL", "5"))        # seconds a readiness check is reused
+AGENT_READY_TIMEOUT = float(os.getenv("AGENT_READY_TIMEOUT", "1"))
+
+_ready = []
+_checked_at = 0.0
+
+
+async def is_ready(url: str) -> bool:
+    try:
+        response = await get_http_client().get(f"{url}/api/status", timeout=AGENT_READY_TIMEOUT)
+        return response.status_code == 200
+    except httpx.HTTPError:
+        return False
+
+
+async def ready_agent_urls() -> list:
+    """Agent workers currently answering /api/status; all of them if none do."""
+    global _ready, _checked_at
+    if len(AGENT_SERVICE_URLS) == 1:
+        return AGENT_SERVICE_URLS
+    if time.monotonic() - _checked_at < AGENT_READY_TTL:
+        return _ready or AGENT_SERVICE_URLS
+
+    checks = await asyncio.gather(*[is_ready(url) for url in AGENT_SERVICE_URLS])
+    ready = [url for url, ok in zip(AGENT_SERVICE_URLS, checks) if ok]
+    _ready, _checked_at = ready, time.monotonic()
+    return ready or AGENT_SERVICE_URLS
+
+
+async def pick_agent_url() -> str:
+    return random.choice(await ready_agent_urls())
+
+
+def public_url(url: str, host: str) -> str:
+    """Rewrites a loopback worker URL to the host the browser reached us on."""
+    for loopback in ("127.0.0.1", "0.0.0.0", "localhost"):
+        if f"//{loopback}:" in url:
+            return url.replace(f"//{loopback}:", f"//{host}:")
+    return url
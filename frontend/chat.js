@@ -28,6 +28,11 @@ console.log('[Chat] Initialized');
         console.log('Attempting to send:', text);
 
         if (!text) return;
+        if (isBackingOff('chat')) {
+            const seconds = Math.ceil((backoffUntil.chat - Date.now()) / 1000);
+            appendMessage('assistant', `Server is busy, please retry in ${seconds}s.`);
+            return;
+        }
 
         appendMessage('user', text);
         chatInput.value = '';
@@ -39,23 +44,41 @@ console.log('[Chat] Initialized');
 
             const loadingId = showLoading();
 
-            const response = await fetch('/api/chat/message', {
+            const response = await fetch('/api/chat/message/stream', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: traceHeaders({ 'Content-Type': 'application/json' }),
                 body: JSON.stringify({ role: 'user', content: text })
             });
 
-
-            removeLoading(loadingId);
-
-            if (response.ok) {
-                const data = await response.json();
-                console.log('API Response:', data);
-                appendMessage('assistant', data.content);
-            } else {
+            if (!response.ok) {
+                removeLoading(loadingId);
                 console.error('API Error:', response.status);
                 appendMessage('assistant', 'Error connecting to AI server.');
+                return;
             }
+
+            let bubble = null;
+            let content = '';
+            await readEventStream(response, (eventName, data) => {
+                if (eventName === 'message' && data.delta) {
+                    content += data.delta;
+                } else if (eventName === 'error') {
+                    noteStreamBackoff('chat', data);
+                    content += data.error || '';
+                } else {
+                    return;
+                }
+
+                if (!bubble) {
+                    removeLoading(loadingId);
+                    bubble = appendStreamingMessage();
+                }
+                bubble.innerHTML = marked.parse(content);
+                scrollToBottom();
+            });
+
+            removeLoading(loadingId);
+            if (!bubble) appendMessage('assistant', content);
         } catch (error) {
             console.error('Chat error:', error);
             const existingLoading = document.getElementById('chat-loading-indicator');
@@ -65,6 +88,19 @@ console.log('[Chat] Initialized');
         }
     }
 
+    function appendStreamingMessage() {
+        const msgDiv = document.createElement('div');
+        msgDiv.className = 'chat-message assistant';
+
+        const bubble = document.createElement('div');
+        bubble.className = 'chat-bubble assistant';
+        msgDiv.appendChild(bubble);
+
+        chatHistory.appendChild(msgDiv);
+        scrollToBottom();
+        return bubble;
+    }
+
     function showLoading() {
         const id = 'chat-loading-indicator';
         const msgDiv = document.createElement('div');
@@ -2,6 +2,9 @@ let ghostDebounceTimer = null;
 const ghostMap = new Map();
 const touchedFields = new Set();
 const draftQueue = new BoundedRequestQueue(1);
+// Tags completion requests so the server can cancel the one a newer request supersedes.
+const completionSessionId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : String(Math.random()).slice(2);
+let completionAbort = null;
 
 function BoundedRequestQueue(concurrency) {
     this.concurrency = concurrency;
@@ -40,6 +43,7 @@ function initGhostText() {
             touchedFields.add(el.id);
             clearGhost(el.id);
             syncGhostHeight(el);
+            if (typeof sendConsultationFields === 'function') sendConsultationFields();
 
             const backdrop = document.getElementById(`gh_${el.id}`);
             if (backdrop) backdrop.scrollTop = el.scrollTop;
@@ -87,8 +91,7 @@ window.resetGhostState = function () {
     ghostMap.clear();
     touchedFields.clear();
 
-    const fields = ['main_complaint', 'history_present_illness', 'past_history', 'physical_exam', 'auxiliary_exam', 'diagnosis', 'orders'];
-    fields.forEach(fid => {
+    DRAFT_FIELDS.forEach(fid => {
 
         renderGhost(fid, "", "");
 
@@ -165,83 +168,115 @@ function syncGhostHeight(el) {
 
 function debouncedFetchCompletion(fieldId, text) {
     clearTimeout(ghostDebounceTimer);
+    if (completionAbort) {
+        completionAbort.abort();
+        completionAbort = null;
+    }
 
-    if (!appSettings.ghostText) return;
+    if (!appSettings.ghostText || isBackingOff('completion')) return;
 
     const el = document.getElementById(fieldId);
     if (!el || el.selectionEnd !== el.value.length) return;
 
     ghostDebounceTimer = setTimeout(async () => {
         const currentVersion = stateVersion;
+        const controller = new AbortController();
+        completionAbort = controller;
         try {
 
-            const res = await fetch(`${API_BASE_AGENT}/agent/complete`, {
+            const res = await fetch(`${API_BASE_AGENT}/agent/complete/stream`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: traceHeaders({ 'Content-Type': 'application/json' }),
                 body: JSON.stringify({
                     field_id: fieldId,
                     current_text: text,
-                    summary: window.currentSummary || ""
-                })
+                    summary: window.currentSummary || "",
+                    session_id: completionSessionId
+                }),
+                signal: controller.signal
             });
-            if (res.ok) {
-                const data = await res.json();
-                if (stateVersion !== currentVersion) return;
-
-                if (data.completion) {
-                    if (document.activeElement !== el) return;
-                    let rawCompletion = data.completion;
-                    if (rawCompletion.startsWith(text)) rawCompletion = rawCompletion.substring(text.length);
-                    if (isValidDraft(rawCompletion)) {
-                        ghostMap.set(fieldId, rawCompletion);
-                        renderGhost(fieldId, text, rawCompletion);
-                    }
+            if (!res.ok) return;
+
+            let rawCompletion = "";
+            await readEventStream(res, (eventName, data) => {
+                if (eventName === 'error') noteStreamBackoff('completion', data);
+                if (stateVersion !== currentVersion) return false;
+                if (document.activeElement !== el || el.value !== text) return false;
+
+                if (eventName === 'message' && data.delta) {
+                    rawCompletion += data.delta;
+                } else if (eventName === 'done') {
+                    rawCompletion = data.completion || "";
+                } else {
+                    return;
                 }
-            }
+
+                if (rawCompletion.startsWith(text)) rawCompletion = rawCompletion.substring(text.length);
+                if (isValidDraft(rawCompletion)) {
+                    ghostMap.set(fieldId, rawCompletion);
+                    renderGhost(fieldId, text, rawCompletion);
+                } else if (eventName === 'done') {
+                    clearGhost(fieldId);
+                }
+            });
         } catch (e) {
-            console.error(e);
+            if (e.name !== 'AbortError') console.error(e);
+        } finally {
+            if (completionAbort === controller) completionAbort = null;
         }
     }, 1000);
 }
 
-function triggerDraftsForEmptyFields() {
-    if (!appSettings.ghostText) return;
+const DRAFT_FIELDS = ['main_complaint', 'history_present_illness', 'past_history', 'physical_exam', 'auxiliary_exam', 'diagnosis', 'orders'];
+
+function isOpenForDraft(fid) {
+    const el = document.getElementById(fid);
+    return el && !touchedFields.has(fid) && el.value.trim() === "";
+}
 
-    const fields = ['main_complaint', 'history_present_illness', 'past_history', 'physical_exam', 'auxiliary_exam', 'diagnosis', 'orders'];
+function emptyDraftFields() {
+    if (!appSettings.ghostText) return [];
+    return DRAFT_FIELDS.filter(isOpenForDraft);
+}
+
+function applyBatchDrafts(data, fields) {
     fields.forEach((fid) => {
-        const el = document.getElementById(fid);
+        if (!isOpenForDraft(fid)) return;
+
+        const draft = (data.drafts || {})[fid];
+        if (isValidDraft(draft)) {
+            ghostMap.set(fid, draft);
+            renderGhost(fid, "", draft);
+        } else {
+            clearGhost(fid);
+        }
 
-        if (!el || touchedFields.has(fid) || el.value.trim() !== "") return;
+        const suggestions = (data.suggestions || {})[fid];
+        if (suggestions && suggestions.length > 0 && typeof renderSuggestionsForField === 'function') {
+            renderSuggestionsForField(fid, suggestions);
+        }
+    });
+}
 
-        const currentVersion = stateVersion;
-        draftQueue.add(async () => {
-            if (stateVersion !== currentVersion) return; 
-            try {
-                const res = await fetch(`${API_BASE_AGENT}/agent/draft`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ summary: window.currentSummary, field_id: fid })
-                });
-                if (res.ok) {
-                    const data = await res.json();
-                    if (stateVersion !== currentVersion) return;
-                    if (el.value.trim() !== "" || touchedFields.has(fid)) return;
-
-                    let draft = data.draft;
-                    if (isValidDraft(draft)) {
-                        ghostMap.set(fid, draft);
-                        renderGhost(fid, "", draft);
-                    }
+function triggerDraftsForEmptyFields() {
+    const emptyFields = emptyDraftFields();
+    if (emptyFields.length === 0 || isBackingOff('drafts')) return;
 
-                    if (data.suggestions && data.suggestions.length > 0) {
+    // One batched request drafts every empty field at once.
+    const currentVersion = stateVersion;
+    draftQueue.add(async () => {
+        if (stateVersion !== currentVersion || isBackingOff('drafts')) return;
+        try {
+            const res = await fetch(`${API_BASE_AGENT}/agent/drafts`, {
+                method: 'POST',
+                headers: traceHeaders({ 'Content-Type': 'application/json' }),
+                body: JSON.stringify({ summary: window.currentSummary, field_ids: emptyFields })
+            });
+            noteBackoff('drafts', res);
+            if (!res.ok || stateVersion !== currentVersion) return;
 
-                        if (typeof renderSuggestionsForField === 'function') {
-                            renderSuggestionsForField(fid, data.suggestions);
-                        }
-                    }
-                }
-            } catch (e) { console.error(e); }
-        });
+            applyBatchDrafts(await res.json(), emptyFields);
+        } catch (e) { console.error(e); }
     });
 }
 
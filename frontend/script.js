@@ -1,7 +1,88 @@
 const API_BASE_AUDIO = 'http://localhost:8000/api';
-const API_BASE_AGENT = 'http://localhost:8001/api';
+let API_BASE_AGENT = 'http://localhost:8001/api';
+
+// A fresh trace id per request; the backend echoes it with a Server-Timing breakdown
+// (see /api/traces/{id} on either service).
+function traceHeaders(headers = {}) {
+    const id = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID().replace(/-/g, '').slice(0, 16)
+        : Math.random().toString(16).slice(2, 18);
+    return { ...headers, 'X-Trace-Id': id };
+}
+
+// Background loops (summary, drafts, ghost text) skip their next ticks after a 429
+// until the server's Retry-After has passed. Streams have already sent 200 when the
+// scheduler sheds them, so they report it as an error event carrying retry_after.
+const backoffUntil = {};
+
+function retryAfterMs(res, fallbackMs = 5000) {
+    const seconds = parseFloat(res.headers.get('Retry-After'));
+    return Number.isFinite(seconds) && seconds >= 0 ? seconds * 1000 : fallbackMs;
+}
+
+function noteBackoff(name, res) {
+    if (res.status !== 429) return false;
+    backoffUntil[name] = Date.now() + retryAfterMs(res);
+    return true;
+}
+
+function noteStreamBackoff(name, data) {
+    const seconds = parseFloat(data && data.retry_after);
+    if (!Number.isFinite(seconds) || seconds < 0) return false;
+    backoffUntil[name] = Date.now() + seconds * 1000;
+    return true;
+}
+
+function isBackingOff(name) {
+    return Date.now() < (backoffUntil[name] || 0);
+}
+
+async function loadClientConfig() {
+    try {
+        const res = await fetch(`${API_BASE_AUDIO}/config`);
+        if (!res.ok) return;
+        const bases = (await res.json()).agent_bases || [];
+        // Agent sessions live in one worker's memory, so this page stays on the one it picks.
+        if (bases.length) API_BASE_AGENT = bases[Math.floor(Math.random() * bases.length)];
+    } catch (e) {
+        console.warn('[Config] Falling back to the default agent service', e);
+    }
+}
+
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+
+            if (onEvent(eventName, JSON.parse(data)) === false) {
+                await reader.cancel();
+                return;
+            }
+        }
+    }
+}
 
 var appSettings = {
+    streamingAsr: true,
+    consultationChannel: true,
     autoSummary: true,
     ghostText: true,
     terminology: true
@@ -72,6 +153,7 @@ function initSettings() {
         aiToggle.addEventListener('change', (e) => {
             appSettings.autoSummary = e.target.checked;
             toggleAiSummaryUi(appSettings.autoSummary);
+            sendConsultationMessage({ type: 'config', summary: appSettings.autoSummary });
         });
 
         toggleAiSummaryUi(appSettings.autoSummary);
@@ -84,6 +166,7 @@ function initSettings() {
                 document.querySelectorAll('.ghost-backdrop').forEach(el => el.innerHTML = '');
                 ghostMap.clear();
             }
+            sendConsultationFields();
         });
     }
     if (termToggle) {
@@ -99,6 +182,7 @@ function initSettings() {
 }
 
 document.addEventListener('DOMContentLoaded', () => {
+    loadClientConfig();
     initSettings();
     initMetricsTracking();
 });
@@ -197,7 +281,7 @@ async function submitRecord() {
     try {
         const res = await fetch(`${API_BASE_AUDIO}/records/`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: traceHeaders({ 'Content-Type': 'application/json' }),
             body: JSON.stringify(data)
         });
 
@@ -301,6 +385,15 @@ let lastFlushTime = 0;
 let isRestarting = false;    
 let transcriptionQueue = Promise.resolve(); 
 
+const ASR_SAMPLE_RATE = 16000;
+let asrSocket = null;
+let drainingSocket = null;    // stopped socket still delivering the flushed final segment
+let audioContext = null;
+let audioSource = null;
+let audioProcessor = null;
+let micStream = null;
+let partialText = "";
+
 async function toggleRecording() {
     const btn = document.getElementById('btn-record');
     if (isRecording) {
@@ -313,65 +406,17 @@ async function toggleRecording() {
 async function startRecording() {
     try {
         const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-        mediaRecorder = new MediaRecorder(stream);
-        audioChunks = [];
-
-
-        const sliceTime = 1500; 
         lastFlushTime = Date.now();
         committedText = "";
+        partialText = "";
         window.fullSessionTranscript = "";
 
-        let webmHeader = null; 
-
-        mediaRecorder.ondataavailable = async (event) => {
-            if (event.data.size > 0) {
-
-                if (!webmHeader) {
-                    webmHeader = event.data;
-                    console.log("[Diagnose] New Segment Header Captured:", webmHeader.size);
-                }
-
-
-                audioChunks.push(event.data);
-                const currentBlob = new Blob(audioChunks, { type: 'audio/webm' });
-
-                transcriptionQueue = transcriptionQueue.then(() => sendAudioToBackend(currentBlob))
-                    .catch(e => console.error("Queue Error:", e));
-
-                const now = Date.now();
-                if (now - lastFlushTime > 10000) {
-                    console.log("🔄 [Auto-Restart] Refreshing MediaRecorder to clear header...");
-                    isRestarting = true;
-                    if (window.fullSessionTranscript) {
-                        committedText = window.fullSessionTranscript;
-                    }
-                    mediaRecorder.stop(); 
-                    lastFlushTime = now;
-                }
-            }
-        };
-
-        mediaRecorder.onstop = () => {
-            if (isRestarting) {
-
-                isRestarting = false;
-                audioChunks = []; 
-                webmHeader = null;
-                mediaRecorder.start(sliceTime); 
-                console.log("▶️ [Auto-Restart] MediaRecorder resumed.");
-            } else {
-
-                document.getElementById('btn-record').innerHTML = '开始录音';
-                document.getElementById('btn-record').classList.remove('bg-red-500', 'hover:bg-red-600');
-                document.getElementById('btn-record').classList.add('bg-blue-500', 'hover:bg-blue-600');
-                document.querySelector('.input-status').innerText = '录音已结束';
-                clearInterval(recordingTimerInterval);
-            }
-        };
+        if (appSettings.streamingAsr) {
+            startStreamingCapture(stream);
+        } else {
+            startChunkedRecorder(stream);
+        }
 
-        mediaRecorder.start(sliceTime);
-        console.log("[Diagnose] MediaRecorder started! State:", mediaRecorder.state);
         isRecording = true;
         document.getElementById('btn-record').innerHTML = '<i class="fa-solid fa-stop"></i> 停止录音';
         document.getElementById('btn-record').classList.remove('bg-blue-500', 'hover:bg-blue-600');
@@ -385,7 +430,7 @@ async function startRecording() {
         document.getElementById('record-timer').innerText = "00:00:00";
         recordingTimerInterval = setInterval(updateTimer, 1000);
 
-        if (appSettings.autoSummary) {
+        if (appSettings.autoSummary && !usesConsultationChannel()) {
             startSummaryAgent();
         }
 
@@ -395,8 +440,226 @@ async function startRecording() {
     }
 }
 
+function startChunkedRecorder(stream) {
+    mediaRecorder = new MediaRecorder(stream);
+    audioChunks = [];
+
+    const sliceTime = 1500; 
+    let webmHeader = null; 
+
+    mediaRecorder.ondataavailable = async (event) => {
+        if (event.data.size > 0) {
+
+            if (!webmHeader) {
+                webmHeader = event.data;
+                console.log("[Diagnose] New Segment Header Captured:", webmHeader.size);
+            }
+
+
+            audioChunks.push(event.data);
+            const currentBlob = new Blob(audioChunks, { type: 'audio/webm' });
+
+            transcriptionQueue = transcriptionQueue.then(() => sendAudioToBackend(currentBlob))
+                .catch(e => console.error("Queue Error:", e));
+
+            const now = Date.now();
+            if (now - lastFlushTime > 10000) {
+                console.log("🔄 [Auto-Restart] Refreshing MediaRecorder to clear header...");
+                isRestarting = true;
+                if (window.fullSessionTranscript) {
+                    committedText = window.fullSessionTranscript;
+                }
+                mediaRecorder.stop(); 
+                lastFlushTime = now;
+            }
+        }
+    };
+
+    mediaRecorder.onstop = () => {
+        if (isRestarting) {
+
+            isRestarting = false;
+            audioChunks = []; 
+            webmHeader = null;
+            mediaRecorder.start(sliceTime); 
+            console.log("▶️ [Auto-Restart] MediaRecorder resumed.");
+        } else {
+
+            document.getElementById('btn-record').innerHTML = '开始录音';
+            document.getElementById('btn-record').classList.remove('bg-red-500', 'hover:bg-red-600');
+            document.getElementById('btn-record').classList.add('bg-blue-500', 'hover:bg-blue-600');
+            document.querySelector('.input-status').innerText = '录音已结束';
+            clearInterval(recordingTimerInterval);
+        }
+    };
+
+    mediaRecorder.start(sliceTime);
+    console.log("[Diagnose] MediaRecorder started! State:", mediaRecorder.state);
+}
+
+function usesConsultationChannel() {
+    return appSettings.streamingAsr && appSettings.consultationChannel;
+}
+
+function startStreamingCapture(stream) {
+    micStream = stream;
+    const path = usesConsultationChannel() ? '/consultation/ws' : '/audio/ws';
+    const socket = new WebSocket(API_BASE_AUDIO.replace(/^http/, 'ws') + path);
+    asrSocket = socket;
+    asrSocket.binaryType = 'arraybuffer';
+    lastSentFields = null;
+    asrSocket.onopen = () => {
+        if (!usesConsultationChannel()) return;
+        sendConsultationMessage({ type: 'config', summary: appSettings.autoSummary });
+        sendConsultationFields();
+    };
+    asrSocket.onmessage = (event) => {
+        if (socket !== asrSocket && socket !== drainingSocket) return;
+        try {
+            handleConsultationEvent(JSON.parse(event.data));
+        } catch (e) {
+            console.error("ASR message error:", e);
+        }
+    };
+    asrSocket.onerror = (e) => console.error("ASR socket error:", e);
+    asrSocket.onclose = () => {
+        if (drainingSocket === socket) drainingSocket = null;
+    };
+
+    audioContext = new (window.AudioContext || window.webkitAudioContext)();
+    audioSource = audioContext.createMediaStreamSource(stream);
+    audioProcessor = audioContext.createScriptProcessor(4096, 1, 1);
+
+    audioProcessor.onaudioprocess = (event) => {
+        if (!asrSocket || asrSocket.readyState !== WebSocket.OPEN) return;
+        const pcm = downsampleToInt16(event.inputBuffer.getChannelData(0), audioContext.sampleRate, ASR_SAMPLE_RATE);
+        if (pcm.length > 0) asrSocket.send(pcm.buffer);
+    };
+
+    audioSource.connect(audioProcessor);
+    audioProcessor.connect(audioContext.destination);
+    console.log("[Diagnose] Streaming ASR started at", audioContext.sampleRate, "Hz");
+}
+
+function stopStreamingCapture() {
+    if (audioProcessor) {
+        audioProcessor.onaudioprocess = null;
+        audioProcessor.disconnect();
+    }
+    if (audioSource) audioSource.disconnect();
+    if (audioContext) audioContext.close();
+    if (micStream) micStream.getTracks().forEach(track => track.stop());
+
+    const socket = asrSocket;
+    if (socket) {
+        if (socket.readyState === WebSocket.OPEN) {
+            // The server flushes the open segment and answers with "done".
+            drainingSocket = socket;
+            socket.send(JSON.stringify({ type: 'stop' }));
+        }
+        setTimeout(() => socket.close(), 3000);
+    }
+
+    asrSocket = null;
+    audioContext = null;
+    audioSource = null;
+    audioProcessor = null;
+    micStream = null;
+}
+
+function handleAsrEvent(event) {
+    // After stop, only the flushed final segment of the draining socket is still wanted.
+    if (!isRecording && !(drainingSocket && event.type === 'final')) return;
+
+    if (event.type === 'final') {
+        committedText += event.text || "";
+        partialText = "";
+    } else if (event.type === 'partial') {
+        partialText = event.text || "";
+    } else {
+        return;
+    }
+
+    window.fullSessionTranscript = committedText;
+    window.partialTranscript = partialText;
+    console.log(`📝 [${event.type} ${event.start}s-${event.end}s]:`, event.text);
+}
+
+// --- Consultation channel: one socket for ASR, summary, drafts and terminology ---
+
+let lastSentFields = null;
+
+function sendConsultationMessage(message) {
+    if (!usesConsultationChannel() || !asrSocket || asrSocket.readyState !== WebSocket.OPEN) return false;
+    asrSocket.send(JSON.stringify(message));
+    return true;
+}
+
+function sendConsultationFields() {
+    const empty = typeof emptyDraftFields === 'function' ? emptyDraftFields() : [];
+    const key = empty.join(',');
+    if (key === lastSentFields) return;
+    if (sendConsultationMessage({ type: 'fields', empty: empty })) lastSentFields = key;
+}
+
+function handleConsultationEvent(event) {
+    switch (event.type) {
+        case 'partial':
+        case 'final':
+            handleAsrEvent(event);
+            break;
+        case 'summary':
+            if (!isRecording || !appSettings.autoSummary) return;
+            currentSummary = event.summary;
+            window.currentSummary = currentSummary;
+            document.getElementById('ai-summary-box').innerText = currentSummary;
+            updateSummaryStatus("已更新");
+            break;
+        case 'drafts':
+            if (typeof applyBatchDrafts === 'function') {
+                applyBatchDrafts(event, Object.keys(event.drafts || {}));
+            }
+            break;
+        case 'terminology':
+            if (typeof applyTerminologyIssues === 'function') {
+                applyTerminologyIssues(event.field_id, event.text, event.issues || []);
+            }
+            break;
+        case 'done':
+            if (drainingSocket) {
+                drainingSocket.close();
+                drainingSocket = null;
+            }
+            break;
+        case 'error':
+            console.error(`[Consultation] ${event.stage} error:`, event.message);
+            if (event.stage === 'summary') updateSummaryStatus("总结失败");
+            break;
+    }
+}
+
+function downsampleToInt16(input, inputRate, outputRate) {
+    const ratio = inputRate / outputRate;
+    const length = Math.floor(input.length / ratio);
+    const output = new Int16Array(length);
+
+    for (let i = 0; i < length; i++) {
+        const from = Math.floor(i * ratio);
+        const to = Math.min(input.length, Math.floor((i + 1) * ratio));
+        let sum = 0;
+        for (let j = from; j < to; j++) sum += input[j];
+        const sample = Math.max(-1, Math.min(1, sum / Math.max(1, to - from)));
+        output[i] = sample < 0 ? sample * 0x8000 : sample * 0x7FFF;
+    }
+    return output;
+}
+
 function stopRecording() {
     isRestarting = false; 
+
+    if (asrSocket || audioContext) {
+        stopStreamingCapture();
+    }
     
     if (mediaRecorder && mediaRecorder.state !== 'inactive') {
         mediaRecorder.stop();
@@ -444,7 +707,9 @@ async function sendAudioToBackend(blob) {
 
 function clearRecording() {
     window.fullSessionTranscript = "";
+    window.partialTranscript = "";
     committedText = "";
+    partialText = "";
     lastProcessedLength = 0; 
     document.getElementById('record-timer').innerText = "00:00:00";
     document.querySelector('.input-status').innerText = '录音已暂停';
@@ -454,12 +719,21 @@ function clearRecording() {
 let summaryInterval = null;
 let lastProcessedLength = 0;
 let currentSummary = "";
+let summarySessionId = null;
 
 let summaryVersion = 0;
 
+async function createSummarySession() {
+    const res = await fetch(`${API_BASE_AGENT}/agent/session`, { method: 'POST' });
+    if (!res.ok) throw new Error(`session create failed: ${res.status}`);
+    const data = await res.json();
+    summarySessionId = data.session_id;
+    return summarySessionId;
+}
+
 function startSummaryAgent() {
     summaryInterval = setInterval(async () => {
-        if (!isRecording || !appSettings.autoSummary) return;
+        if (!isRecording || !appSettings.autoSummary || isBackingOff('summary')) return;
 
         const currentVersion = summaryVersion; 
         const fullText = window.fullSessionTranscript || "";
@@ -470,21 +744,37 @@ function startSummaryAgent() {
             console.log("[Diagnose] Summary Agent Input:", newText);
             updateSummaryStatus("正在总结...");
             try {
-                const res = await fetch(`${API_BASE_AGENT}/agent/summary`, {
+                if (!summarySessionId) await createSummarySession();
+
+                // The session keeps the summary server-side; only new transcript is sent.
+                let res = await fetch(`${API_BASE_AGENT}/agent/session/${summarySessionId}/update`, {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ current_summary: currentSummary, new_text: newText })
+                    headers: traceHeaders({ 'Content-Type': 'application/json' }),
+                    body: JSON.stringify({ text: newText, offset: lastProcessedLength })
                 });
+                if (res.status === 404) {
+                    // Session expired server-side: start over from the whole transcript.
+                    await createSummarySession();
+                    res = await fetch(`${API_BASE_AGENT}/agent/session/${summarySessionId}/update`, {
+                        method: 'POST',
+                        headers: traceHeaders({ 'Content-Type': 'application/json' }),
+                        body: JSON.stringify({ text: fullText, offset: 0 })
+                    });
+                }
+                if (noteBackoff('summary', res)) {
+                    updateSummaryStatus("服务繁忙，稍后重试");
+                    return;
+                }
 
                 if (res.ok) {
                     const data = await res.json();
                     if (summaryVersion !== currentVersion) return; 
 
-                    if (data.updated_summary) {
-                        currentSummary = data.updated_summary;
+                    lastProcessedLength = data.offset;
+                    if (data.summary && data.summary !== currentSummary) {
+                        currentSummary = data.summary;
                         window.currentSummary = currentSummary; 
                         document.getElementById('ai-summary-box').innerText = currentSummary;
-                        lastProcessedLength = fullText.length;
                         triggerDraftsForEmptyFields();
                     }
                     updateSummaryStatus("已更新");
@@ -503,6 +793,10 @@ function stopSummaryAgent() {
     updateSummaryStatus("");
     lastProcessedLength = 0; 
 
+    if (summarySessionId) {
+        fetch(`${API_BASE_AGENT}/agent/session/${summarySessionId}`, { method: 'DELETE' }).catch(() => {});
+        summarySessionId = null;
+    }
 
     currentSummary = "";
     window.currentSummary = "";
@@ -80,11 +80,17 @@ async function performTerminologyCheck(fieldId, text) {
     lastCheckTime.set(fieldId, Date.now());
     console.log(`[Terminology] Performing check for ${fieldId}, text: "${text.substring(0, 30)}..."`);
 
+    // While a consultation socket is open the result comes back as a pushed event.
+    if (typeof sendConsultationMessage === 'function' &&
+        sendConsultationMessage({ type: 'field', field_id: fieldId, text: text, rev: Date.now() })) {
+        return;
+    }
+
     try {
         console.log(`[Terminology] API call to ${API_BASE_AUDIO}/terminology/check`);
         const res = await fetch(`${API_BASE_AUDIO}/terminology/check`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: traceHeaders({ 'Content-Type': 'application/json' }),
             body: JSON.stringify({ text: text })
         });
 
@@ -92,24 +98,7 @@ async function performTerminologyCheck(fieldId, text) {
 
         if (res.ok) {
             const data = await res.json();
-
-
-            const currentEl = document.getElementById(fieldId);
-            if (currentEl && currentEl.value !== text) {
-                console.log(`[Terminology] Text changed during API call, discarding results for ${fieldId}`);
-                return;
-            }
-
-            let issues = data.issues || [];
-            console.log(`[Terminology] Received ${issues.length} issues:`, issues);
-
-            const ignoredSet = ignoredIssuesMap.get(fieldId) || new Set();
-            issues = issues.filter(issue => !ignoredSet.has(issue.original));
-            console.log(`[Terminology] After filtering: ${issues.length} issues`);
-
-            terminologyIssuesMap.set(fieldId, issues);
-            console.log(`[Terminology] Calling renderTerminologyUnderlines for ${fieldId}`);
-            renderTerminologyUnderlines(fieldId);
+            applyTerminologyIssues(fieldId, text, data.issues || []);
         } else {
             console.error(`[Terminology] API error: ${res.status}`);
         }
@@ -118,6 +107,24 @@ async function performTerminologyCheck(fieldId, text) {
     }
 }
 
+function applyTerminologyIssues(fieldId, text, issues) {
+    const currentEl = document.getElementById(fieldId);
+    if (currentEl && currentEl.value !== text) {
+        console.log(`[Terminology] Text changed during API call, discarding results for ${fieldId}`);
+        return;
+    }
+
+    console.log(`[Terminology] Received ${issues.length} issues:`, issues);
+
+    const ignoredSet = ignoredIssuesMap.get(fieldId) || new Set();
+    issues = issues.filter(issue => !ignoredSet.has(issue.original));
+    console.log(`[Terminology] After filtering: ${issues.length} issues`);
+
+    terminologyIssuesMap.set(fieldId, issues);
+    console.log(`[Terminology] Calling renderTerminologyUnderlines for ${fieldId}`);
+    renderTerminologyUnderlines(fieldId);
+}
+
 
 function renderTerminologyUnderlines(fieldId) {
     const el = document.getElementById(fieldId);
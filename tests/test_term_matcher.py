@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from backend.agents.terminology_agent import terminology_agent
+from backend.utils.term_matcher import TermMatcher
+
+
+def correct(text: str) -> str:
+    return asyncio.run(terminology_agent.correct_text(text))
+
+
+@pytest.mark.parametrize("text", [
+    "建议同时复查血常规。",
+    "口服布洛芬，并且多饮水。",
+    "咳嗽、咳痰，吐黄痰2天。",
+    "无烧伤史。",
+])
+def test_correct_text_leaves_context_dependent_words(text):
+    assert correct(text) == text
+
+
+def test_correct_text_rewrites_unambiguous_entries():
+    assert correct("发烧3天，肚子疼，吐了两次。") == "发热3天，腹痛，吐了两次。"
+
+
+def test_protected_compounds_are_not_reported():
+    assert terminology_agent.matcher.issues("咳嗽、咳痰，吐黄痰2天。") == []
+    assert terminology_agent.matcher.issues("无烧伤史。") == []
+
+
+def test_ambiguous_entries_are_reported_not_applied():
+    matcher = TermMatcher({"同时": "伴", "吐": "呕吐", "肚子疼": "腹痛"}, ambiguous=["同时"])
+    text = "肚子疼，同时吐了"
+    assert [issue["original"] for issue in matcher.issues(text)] == ["肚子疼", "同时", "吐"]
+    assert matcher.replacements(text) == [(0, 3, "腹痛")]
+    assert matcher.apply(text) == "腹痛，同时吐了"
+
+
+def check_with_llm(monkeypatch, sentence, llm_issues):
+    calls = []
+
+    async def fake_llm_check(text):
+        calls.append(text)
+        return llm_issues
+
+    async def no_shared(method, *args):
+        return None
+
+    monkeypatch.setattr(terminology_agent, "_llm_check", fake_llm_check)
+    monkeypatch.setattr(terminology_agent, "_shared_call", no_shared)
+    issues, cacheable = asyncio.run(terminology_agent._check_sentence(sentence))
+    return issues, cacheable, calls
+
+
+def test_protected_only_sentence_falls_back_to_llm(monkeypatch):
+    llm_issues = [{"original": "头晕眼花", "suggestion": "头晕", "start": 3, "end": 7}]
+    issues, cacheable, calls = check_with_llm(monkeypatch, "发热伴头晕眼花", llm_issues)
+    assert calls == ["发热伴头晕眼花"]
+    assert issues == llm_issues and cacheable
+
+
+def test_lexicon_replacement_skips_llm(monkeypatch):
+    issues, _, calls = check_with_llm(monkeypatch, "肚子疼两天", [])
+    assert calls == []
+    assert [issue["suggestion"] for issue in issues] == ["腹痛"]
+
+
+def test_failed_llm_check_keeps_ambiguous_issues_uncached(monkeypatch):
+    issues, cacheable, calls = check_with_llm(monkeypatch, "建议同时复查血常规", None)
+    assert calls == ["建议同时复查血常规"]
+    assert [issue["original"] for issue in issues] == ["同时"] and not cacheable